@@ -1,4 +1,9 @@
-from matplotlib.animation import FuncAnimation
+import os
+import matplotlib
+# batch runs that only save animations do not need an interactive backend
+if os.environ.get("HEADLESS", "0") == "1":
+    matplotlib.use("Agg")
+from matplotlib.animation import FuncAnimation, FFMpegWriter
 import matplotlib.pyplot as plt
 import numpy as np
 
@@ -39,15 +44,25 @@ class Animator(object):
         Returns:
             self
         """        
-        self._time, self._positions, self._orientations = simulationData
+        self._time, positions, orientations = simulationData
+        # single precision is plenty for rendering and halves the memory needed for long runs
+        positions = np.asarray(positions)
+        orientations = np.asarray(orientations)
+        self._posX = np.ascontiguousarray(positions[..., 0], dtype=np.float32)
+        self._posY = np.ascontiguousarray(positions[..., 1], dtype=np.float32)
+        self._orientX = np.ascontiguousarray(orientations[..., 0], dtype=np.float32)
+        self._orientY = np.ascontiguousarray(orientations[..., 1], dtype=np.float32)
         self._domainSize = domainSize
 
         if colours is None: # if the colours are provided, we don't mess with those as they may show an example
-            a = np.array(len(self._positions[0]) * ['k'])
+            # the colours do not change over time, so a single frame is stored for all timesteps
+            a = np.full(self._posX.shape[1], 'k', dtype='<U1')
             if len(redIndices) > 0:
                 a[redIndices] = 'r'
-            self._colours = len(self._time) * [a.tolist()]
+            self._staticColours = a
+            self._colours = None
         else:
+            self._staticColours = None
             self._colours = colours
         
         self._showRadusForExample = showRadiusForExample
@@ -96,11 +111,24 @@ class Animator(object):
         """
         print("Saving commenced...")
         animation = self._getAnimation()
-        animation.save(filename=filename, writer="ffmpeg")
+        writer = FFMpegWriter(fps=fpsVar, codec="libx264", extra_args=["-preset", "ultrafast", "-crf", "23"])
+        animation.save(filename=filename, writer=writer)
         print("Saving completed.")
         #plt.close()
         return self
     
+    def _initAnimation(self):
+        """
+        Creates the artists that are reused for every frame. Overridden by the concrete animators.
+
+        Parameters:
+            None
+
+        Returns:
+            The artists that are updated at every frame.
+        """
+        return []
+
     def _getAnimation(self):
         return self.animation if 'animation' in self.__dict__ else self._generateAnimation()
 
@@ -114,6 +142,6 @@ class Animator(object):
         Returns
             animation object
         """
-        self.animation = FuncAnimation(self._matplotlibFigure, self._animate, interval=self._frameInterval, frames = self._frames)
+        self.animation = FuncAnimation(self._matplotlibFigure, self._animate, init_func=self._initAnimation, interval=self._frameInterval, frames = self._frames, blit=True)
 
         return self.animation
@@ -1,5 +1,5 @@
-import matplotlib.pyplot as plt
 import matplotlib.patches as patches
+import numpy as np
 import animator.Animator as Animator
 
 class Animator2D(Animator.Animator):
@@ -10,6 +10,38 @@ class Animator2D(Animator.Animator):
     def __init__(self, modelParams):
         self.setParams(modelParams)
 
+    def _initAnimation(self):
+        """
+        Creates the artists that are reused for every frame of the animation.
+
+        Parameters:
+            None
+
+        Returns:
+            The artists that are updated at every frame.
+        """
+        self._matplotlibFigure.clf()
+        ax = self._matplotlibFigure.gca()
+
+        self._exampleCircle = patches.Circle((0, 0), self._radius, color="#FFC1C3", visible=False)
+        ax.add_patch(self._exampleCircle)
+
+        self._foodCircles = []
+        for foodEvent in self.foodEvents:
+            foodCircle = patches.Circle((foodEvent.areas[0][0], foodEvent.areas[0][1]), self._radius, color="#FFC1C3", visible=False)
+            ax.add_patch(foodCircle)
+            self._foodCircles.append(foodCircle)
+
+        self._quiver = ax.quiver(self._posX[0], self._posY[0], self._orientX[0], self._orientY[0], color=self._getColours(0))
+        # drawn inside the axes as blitting only redraws the area of the axes
+        self._timeText = ax.text(0.02, 0.95, "", transform=ax.transAxes)
+
+        ax.set_aspect("equal")
+        ax.set_xlim(0,self._domainSize[0])
+        ax.set_ylim(0,self._domainSize[1])
+
+        return self._getArtists()
+
     def _animate(self, i):
         """
         Animator class that goes through sim data.
@@ -18,25 +50,39 @@ class Animator2D(Animator.Animator):
             i (int): Loop index.
 
         Returns:
-            Nothing
+            The artists that have been updated.
         """
         if i % 500 == 0:
             print(i)
 
-        plt.clf()
-
         if self._exampleId != None and self._showRadusForExample == True:
-            plt.gca().add_patch(patches.Circle((self._positions[i,self._exampleId, 0], self._positions[i, self._exampleId, 1]), self._radius, color="#FFC1C3"))
-            plt.gca().set_aspect("equal")
-        
-        for foodEvent in self.foodEvents:
-            if i > foodEvent.startTimestep and i <= (foodEvent.startTimestep + foodEvent.duration):
-                plt.gca().add_patch(patches.Circle((foodEvent.areas[0][0], foodEvent.areas[0][1]), self._radius, color="#FFC1C3"))
-        plt.gca().set_aspect("equal")
-            
-        plt.quiver(self._positions[i,:,0],self._positions[i,:,1],self._orientations[i,:,0],self._orientations[i,:,1],color=self._colours[i])
-
-        plt.xlim(0,self._domainSize[0])
-        plt.ylim(0,self._domainSize[1])
-        plt.title(f"$t$={self._time[i]:.2f}")
-        
\ No newline at end of file
+            self._exampleCircle.set_center((self._posX[i, self._exampleId], self._posY[i, self._exampleId]))
+            self._exampleCircle.set_visible(True)
+
+        for foodEvent, foodCircle in zip(self.foodEvents, self._foodCircles):
+            foodCircle.set_visible(i > foodEvent.startTimestep and i <= (foodEvent.startTimestep + foodEvent.duration))
+
+        self._quiver.set_offsets(np.column_stack((self._posX[i], self._posY[i])))
+        self._quiver.set_UVC(self._orientX[i], self._orientY[i])
+        self._quiver.set_color(self._getColours(i))
+
+        self._timeText.set_text(f"$t$={self._time[i]:.2f}")
+
+        return self._getArtists()
+
+    def _getColours(self, i):
+        """
+        Determines the colours of all particles at the given frame.
+
+        Parameters:
+            i (int): Loop index.
+
+        Returns:
+            The colour of every particle.
+        """
+        if self._colours is None:
+            return self._staticColours
+        return self._colours[i]
+
+    def _getArtists(self):
+        return [self._exampleCircle, *self._foodCircles, self._quiver, self._timeText]
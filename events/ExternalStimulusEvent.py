@@ -61,6 +61,9 @@ class ExternalStimulusOrientationChangeEvent(BaseEvent.BaseEvent):
         
         if self.numberOfAffected and self.radius:
             print("Radius is set. The full number of affected particles may not be reached.")
+
+        # reused across timesteps, (re)allocated when the number of particles changes
+        self._posBuffer = None
         
     def getShortPrintVersion(self):
         return f"t{self.startTimestep}d{self.duration}e{self.eventEffect.val}a{self.angle}dt{self.distributionType.value}a{self.areas}"
@@ -93,10 +96,11 @@ class ExternalStimulusOrientationChangeEvent(BaseEvent.BaseEvent):
         Returns:
             The orientations, neighbour selection mechanisms, ks, speeds, blockedness and colour of all particles after the event has been executed.
         """
-        posWithCenter = np.zeros((totalNumberOfParticles+1, 2))
-        posWithCenter[:-1] = positions
-        posWithCenter[-1] = self.getOriginPoint()
-        rij2 = ServiceVicsekHelper.getDifferences(posWithCenter, self.domainSize)
+        if self._posBuffer is None or self._posBuffer.shape[0] != totalNumberOfParticles+1:
+            self._posBuffer = np.empty((totalNumberOfParticles+1, 2))
+        self._posBuffer[:-1] = positions
+        self._posBuffer[-1] = self.getOriginPoint()
+        rij2 = ServiceVicsekHelper.getDifferences(self._posBuffer, self.domainSize)
         relevantDistances = rij2[-1][:-1] # only the comps to the origin and without the origin point
         candidates = (relevantDistances <= self.radius**2)
         affected = self.selectAffected(candidates, relevantDistances)
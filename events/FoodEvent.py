@@ -1,18 +1,5 @@
-import random
-import math
 import numpy as np
-from scipy.spatial.transform import Rotation as R
 
-
-from enums.EnumDistributionType import DistributionType
-from enums.EnumEventEffect import EventEffect
-from enums.EnumEventSelectionType import EventSelectionType
-from enums.EnumColourType import ColourType
-
-import events.BaseEvent as BaseEvent
-
-import services.ServiceOrientations as ServiceOrientations
-import services.ServicePreparation as ServicePreparation
 import services.ServiceVicsekHelper as ServiceVicsekHelper
 
 class FoodEvent:
@@ -20,6 +7,9 @@ class FoodEvent:
     Representation of an event occurring at a specified time and place within the domain and affecting 
     a specified percentage of particles. After creation, the check()-method takes care of everything.
     """
+    # shared read-only masks returned when the event is not triggered, keyed by the number of particles
+    _emptyCache = {}
+
     def __init__(self, startTimestep, amount, domainSize, areas=None, radius=None, stopMovement=True):
         """
         Creates an external stimulus event that affects part of the swarm at a given timestep.
@@ -43,6 +33,7 @@ class FoodEvent:
         self.amount = amount
         self.domainSize = domainSize
         self.areas = areas
+        self._origin = np.asarray(areas[0][:2], dtype=np.float64) if areas else None
         self.radius = radius
         self.stopMovement = stopMovement
 
@@ -52,6 +43,10 @@ class FoodEvent:
             self.radius = radius
 
         self.duration = -1
+
+        # buffers reused across timesteps, (re)allocated when the number of particles changes
+        self._coordinateBuffer = None
+        self._affectedBuffer = None
         
     def getShortPrintVersion(self):
         return f"t{self.startTimestep}d{self.duration}e{self.eventEffect.val}a{self.angle}dt{self.distributionType.value}a{self.areas}"
@@ -68,7 +63,7 @@ class FoodEvent:
 
         return summary
     
-    def check(self, totalNumberOfParticles, currentTimestep, positions, speeds, hungerLevels):
+    def check(self, totalNumberOfParticles, currentTimestep, positions, speeds, hungerLevels, outMask=None):
         """
         Checks if the event is triggered at the current timestep and executes it if relevant.
 
@@ -84,21 +79,42 @@ class FoodEvent:
             - activationTimeDelays (array of int) [optional]: the time delay for the updates of each individual
             - isActivationTimeDelayRelevantForEvent (boolean) [optional]: whether the event can affect particles that may not be ready to update due to a time delay. They may still be selected but will retain their current values
             - colourType (ColourType) [optional]: if and how particles should be encoded for colour for future video rendering
+            - outMask (array of booleans) [optional]: if provided, the particles affected by the event are added to this mask in place
 
         Returns:
             The orientations of all particles - altered if the event has taken place, unaltered otherwise.
         """
-        affected = np.full(totalNumberOfParticles, False)
-        if self.startTimestep >= currentTimestep and self.amount > 0:
+        affected = FoodEvent._emptyCache.get(totalNumberOfParticles)
+        if affected is None:
+            affected = np.zeros(totalNumberOfParticles, dtype=bool)
+            affected.flags.writeable = False
+            FoodEvent._emptyCache[totalNumberOfParticles] = affected
+        if self.startTimestep <= currentTimestep and self.amount > 0:
             self.timestep = currentTimestep
             # if self.timestep % 100 == 0:
             #     print(f"t={currentTimestep}")
             # if currentTimestep == self.startTimestep or currentTimestep == (self.startTimestep + self.duration):
             #     print(f"executing event at timestep {currentTimestep}")
             speeds, hungerLevels, affected = self.executeEvent(totalNumberOfParticles=totalNumberOfParticles, positions=positions, speeds=speeds, hungerLevels=hungerLevels)
-        elif self.duration == -1:
-            self.duration = currentTimestep-self.startTimestep
+            if outMask is not None:
+                np.logical_or(outMask, affected, out=outMask)
+        elif self.startTimestep <= currentTimestep:
+            # the food has run out. Events that have not started yet are not ended
+            self.end(currentTimestep)
         return speeds, hungerLevels, affected
+
+    def end(self, currentTimestep):
+        """
+        Records the duration of the event once it has run out of food. Has no effect before the event has started.
+
+        Params:
+            - currentTimestep (int): the first timestep at which the event is no longer active
+
+        Returns:
+            No return.
+        """
+        if self.duration == -1 and currentTimestep >= self.startTimestep:
+            self.duration = currentTimestep-self.startTimestep
     
     def executeEvent(self, totalNumberOfParticles, positions, speeds, hungerLevels):
         """
@@ -117,13 +133,30 @@ class FoodEvent:
         Returns:
             The orientations, neighbour selection mechanisms, ks, speeds, blockedness and colour of all particles after the event has been executed.
         """
-        posWithCenter = np.zeros((totalNumberOfParticles+1, 2))
-        posWithCenter[:-1] = positions
-        posWithCenter[-1] = self.getOriginPoint()
-        rij2 = ServiceVicsekHelper.getDifferences(posWithCenter, self.domainSize)
-        relevantDistances = rij2[-1][:-1] # only the comps to the origin and without the origin point
-        candidates = (relevantDistances <= self.radius**2)
-        affected = self.selectAffected(candidates, relevantDistances)
+        originX, originY = self.getOriginPoint()
+        if self._coordinateBuffer is None or self._coordinateBuffer.shape[1] != totalNumberOfParticles:
+            self._coordinateBuffer = np.empty((2, totalNumberOfParticles), dtype=np.float32)
+        posX, posY = self._coordinateBuffer
+        posX[:] = positions[:, 0]
+        posY[:] = positions[:, 1]
+        rij2 = ServiceVicsekHelper.getSquaredDistancesFromPoint(posX, posY, np.float32(originX), np.float32(originY), 
+                                                                np.float32(self.domainSize[0]), np.float32(self.domainSize[1]))
+        return self.feed(rij2, speeds, hungerLevels)
+
+    def feed(self, rij2, speeds, hungerLevels):
+        """
+        Feeds the closest particles within the event radius until the food runs out.
+
+        Params:
+            - rij2 (array of floats): the distance squared of every particle to the event focus point
+            - speeds (array of float): the speed of every particle at the current timestep
+            - hungerLevels (array of float): the hunger level of every particle at the current timestep
+
+        Returns:
+            The speeds and hunger levels of all particles and which particles have been fed.
+        """
+        candidates = rij2 <= self.radius**2
+        affected = self.selectAffected(candidates, rij2)
 
         speeds[affected] = 0
         hungerLevels[affected] += 1
@@ -142,20 +175,23 @@ class FoodEvent:
         Returns:
             Array of booleans representing which particles are affected by the event.
         """
-        if self.amount < len(candidates):
-            numberOfAffected = self.amount
-        else:
-            numberOfAffected = len(candidates)
+        numberOfAffected = min(self.amount, np.count_nonzero(candidates))
 
         self.amount -=numberOfAffected
 
-        preselection = candidates # default case, we take all the candidates
-
-        indices = np.argsort(rij2)[:numberOfAffected]
-        preselection = np.full(len(candidates), False)
-        preselection[indices] = True
-
-        return candidates & preselection
+        # non-candidates are pushed to the back so that only the closest candidates are selected
+        maskedDistances = np.where(candidates, rij2, np.inf)
+        if numberOfAffected < len(maskedDistances):
+            indices = np.argpartition(maskedDistances, numberOfAffected)[:numberOfAffected]
+        else:
+            indices = np.nonzero(candidates)[0]
+
+        if self._affectedBuffer is None or len(self._affectedBuffer) != len(candidates):
+            self._affectedBuffer = np.empty(len(candidates), dtype=bool)
+        affected = self._affectedBuffer
+        affected.fill(False)
+        affected[indices] = True
+        return affected
     
     def getOriginPoint(self):
         """
@@ -168,4 +204,4 @@ class FoodEvent:
             The point of origin of the event in [X,Y]-coordinates.
         """
 
-        return self.areas[0][:2]
+        return self._origin
@@ -1,20 +1,31 @@
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 
 from enums.EnumMetrics import Metrics
 from evaluators.EvaluatorAvalanches import EvaluatorAvalanches
 from evaluators.EvaluatorMultiComp import EvaluatorMultiAvgComp
 import services.ServiceSavedModel as ssm
 
-for noisePercentage in [1,2,3,4]:
-    for use_single_speed in [True, False]:
-        for occlusion_active in [True, False]:
-            for fov in [0.5*np.pi, np.pi, 1.5*np.pi, 2*np.pi]:
-                filename = f"test_singlespeed={use_single_speed}_occl={occlusion_active}_fov={fov}_noiseP={noisePercentage}_d=0.03_r=10_tmax=10000_1"
-                modelParams, simulationData = ssm.loadModels([f"{filename}.json"], loadSwitchValues=False)
-                times, positions, orientations = simulationData[0]
+def evaluate(config):
+    noisePercentage, use_single_speed, vary_speed, occlusion_active, fov = config
+    # matches the files written by exampleVicsek.py
+    filename = f"test_singlespeed={use_single_speed}_vary={vary_speed}_occl={occlusion_active}_fov={fov}_noiseP={noisePercentage}_d=0.03_r=10_tmax=10000_1"
+    modelParams, simulationData = ssm.loadModelCompressed(f"{filename}.npz")
+    times, positions, orientations = simulationData
 
-                evaluator = EvaluatorAvalanches(orientations=orientations, orderThreshold=0.9, savePath=f"avalanches_{filename}", show=False)
-                evaluator.evaluateAvalanches()
+    evaluator = EvaluatorAvalanches(orientations=orientations, orderThreshold=0.9, savePath=f"avalanches_{filename}", show=False)
+    evaluator.evaluateAvalanches()
 
-                evaluator = EvaluatorMultiAvgComp(modelParams=modelParams, metric=Metrics.ORDER, simulationData=simulationData, evaluationTimestepInterval=1)
-                evaluator.evaluateAndVisualize(labels=[''], xLabel='timesteps', yLabel='order', savePath=f"order_{filename}.jpeg")
\ No newline at end of file
+    evaluator = EvaluatorMultiAvgComp(modelParams=[modelParams], metric=Metrics.ORDER, simulationData=[simulationData], evaluationTimestepInterval=1)
+    evaluator.evaluateAndVisualize(labels=[''], xLabel='timesteps', yLabel='order', savePath=f"order_{filename}.jpeg")
+
+if __name__ == "__main__":
+    # every configuration is evaluated independently, so they are spread across all cores
+    configs = [(noisePercentage, use_single_speed, vary_speed, occlusion_active, fov)
+               for noisePercentage in [1,2,3,4]
+               for use_single_speed in [True, False]
+               for vary_speed in [True, False]
+               for occlusion_active in [True, False]
+               for fov in [0.5*np.pi, np.pi, 1.5*np.pi, 2*np.pi]]
+    with ProcessPoolExecutor() as executor:
+        list(executor.map(evaluate, configs))
@@ -1,3 +1,6 @@
+import os
+os.environ["HEADLESS"] = "1" # set before the animator is imported to use the non-interactive backend
+
 import time
 import numpy as np
 
@@ -129,9 +132,9 @@ for i in range(1, 2):
     preparedAnimator.saveAnimation(f"{filename}.mp4")
 
 
-    # ServiceSavedModel.saveModel(simulationData=simulationData, path=f"test_stress_{stress_num_neighbours}_tmax={tmax}_{i}.json", 
-    #                             modelParams=simulator.getParameterSummary(), switchValues=switchTypeValues, colours=colours, 
-    #                             stressLevels=stressLevels, hungerLevels=hungerLevels, alive=alive, foodEvents=foodEvents)
+    # ServiceSavedModel.saveModelCompressed(simulationData=simulationData, path=f"test_stress_{stress_num_neighbours}_tmax={tmax}_{i}.npz", 
+    #                                       modelParams=simulator.getParameterSummary(), switchValues=switchTypeValues, colours=colours, 
+    #                                       stressLevels=stressLevels, hungerLevels=hungerLevels, alive=alive, foodEvents=foodEvents)
 
 tend = time.time()
 ServiceGeneral.logWithTime(f"duration: {ServiceGeneral.formatTime(tend-tstart)}")
\ No newline at end of file
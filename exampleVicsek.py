@@ -1,9 +1,12 @@
+import os
+os.environ["HEADLESS"] = "1" # set before the animator is imported to use the non-interactive backend
+
 import time
 import numpy as np
 
 from animator.AnimatorMatplotlib import MatplotlibAnimator
 from animator.Animator2D import Animator2D
-from model.Vicsek import VicsekWithNeighbourSelection
+from model.Vicsek import VicsekWithNeighbourSelection, runBatch
 from enums.EnumNeighbourSelectionMechanism import NeighbourSelectionMechanism
 from enums.EnumSwitchType import SwitchType
 from events.ExternalStimulusEvent import ExternalStimulusOrientationChangeEvent
@@ -55,45 +58,55 @@ use_single_speed = True
 occlusion_active = False
 fov = 2*np.pi
 
-for noisePercentage in [1,2,3,4]:
-    for use_single_speed in [True, False]:
-        for vary_speed in [True, False]:
-            for occlusion_active in [True, False]:
-                for fov in [0.5*np.pi, np.pi, 1.5*np.pi, 2*np.pi]:
+# the initial state is the same for every run
+baseInitialState = ServicePreparation.createOrderedInitialDistributionEquidistancedIndividual(None, domainSize, n, angleX=0.5, angleY=0.5)
+
+# the simulations only differ in scalar parameters, so the ones without occlusion are run together as a single batch
+configs = []
+simulators = []
+for fov in [0.5*np.pi, np.pi, 1.5*np.pi, 2*np.pi]:
+    for occlusion_active in [True, False]:
+        for noisePercentage in [1,2,3,4]:
+            for use_single_speed in [True, False]:
+                for vary_speed in [True, False]:
                     for i in range(1, 2):
-                        ServiceGeneral.logWithTime(f"noise={noisePercentage}, ss={use_single_speed}, occ={occlusion_active}, fov={fov}, i={i}")
-                        initialState = ServicePreparation.createOrderedInitialDistributionEquidistancedIndividual(None, domainSize, n, angleX=0.5, angleY=0.5)
-                        simulator = VicsekWithNeighbourSelection(domainSize=domainSize,
-                                                                radius=radius,
-                                                                noise=noise,
-                                                                numberOfParticles=n,
-                                                                speed=speed,
-                                                                use_single_speed=use_single_speed,
-                                                                vary_speed_throughout=vary_speed,
-                                                                degreesOfVision=fov,
-                                                                occlusion_active=occlusion_active,
-                                                                returnHistories=True)
-                        simulationData = simulator.simulate(initialState=initialState, tmax=tmax)
-                        #simulationData, switchTypeValues, colours = simulator.simulate(tmax=tmax)
-                        import services.ServiceMetric as sm
-                        times, positions, orientations = simulationData
-                        print("order at end:")
-                        print(sm.computeGlobalOrder(orientations[-1]))
-
-                        ServiceSavedModel.saveModel(simulationData=simulationData, path=f"test_singlespeed={use_single_speed}_vary={vary_speed}_occl={occlusion_active}_fov={fov}_noiseP={noisePercentage}_d={density}_r={radius}_tmax={tmax}_{i}.json", 
-                                                    modelParams=simulator.getParameterSummary())
-                        
-                        """
-                        animator = MatplotlibAnimator(simulationData, (domainSize[0],domainSize[1],100))
-
-                        # prepare the animator
-                        summary = simulator.getParameterSummary()
-                        preparedAnimator = animator.prepare(Animator2D(summary), frames=tmax)
-                        preparedAnimator.setParams(summary)
-
-                        filename = f"test"
-                        preparedAnimator.saveAnimation(f"{filename}.mp4")
-                        """
+                        configs.append((fov, occlusion_active, noisePercentage, use_single_speed, vary_speed, i))
+                        simulators.append(VicsekWithNeighbourSelection(domainSize=domainSize,
+                                                                       radius=radius,
+                                                                       noise=noise,
+                                                                       numberOfParticles=n,
+                                                                       speed=speed,
+                                                                       use_single_speed=use_single_speed,
+                                                                       vary_speed_throughout=vary_speed,
+                                                                       degreesOfVision=fov,
+                                                                       occlusion_active=occlusion_active,
+                                                                       returnHistories=True))
+
+# the simulators update the positions in place, so every run gets a copy
+initialStates = [tuple(np.copy(component) for component in baseInitialState) for _ in simulators]
+allSimulationData = runBatch(simulators, initialStates, tmax=tmax)
+
+import services.ServiceMetric as sm
+for (fov, occlusion_active, noisePercentage, use_single_speed, vary_speed, i), simulator, simulationData in zip(configs, simulators, allSimulationData):
+    ServiceGeneral.logWithTime(f"noise={noisePercentage}, ss={use_single_speed}, occ={occlusion_active}, fov={fov}, i={i}")
+    times, positions, orientations = simulationData
+    print("order at end:")
+    print(sm.computeGlobalOrder(orientations[-1]))
+
+    ServiceSavedModel.saveModelCompressed(simulationData=simulationData, path=f"test_singlespeed={use_single_speed}_vary={vary_speed}_occl={occlusion_active}_fov={fov}_noiseP={noisePercentage}_d={density}_r={radius}_tmax={tmax}_{i}.npz", 
+                                          modelParams=simulator.getParameterSummary())
+    
+    """
+    animator = MatplotlibAnimator(simulationData, (domainSize[0],domainSize[1],100))
+
+    # prepare the animator
+    summary = simulator.getParameterSummary()
+    preparedAnimator = animator.prepare(Animator2D(summary), frames=tmax)
+    preparedAnimator.setParams(summary)
+
+    filename = f"test"
+    preparedAnimator.saveAnimation(f"{filename}.mp4")
+    """
 
 
 tend = time.time()
@@ -0,0 +1,94 @@
+import numpy as np
+
+class SimulationMixin(object):
+    """
+    The parts of the simulation that are shared by all models. The models need to set the random number
+    generator (_rng), the noise amplitude (noise), numberOfParticles, the number of dimensions (_dim),
+    numIntervals, the current timestep (t), dt, the size of the domain as an array (_domain) and the buffer for
+    the velocities (_velocityBuffer) as well as historyPath.
+    """
+
+    def prepareNoise(self, maxBytes=256*1024**2):
+        """
+        Draws the noise for a block of timesteps at once, which is considerably faster than drawing it anew at
+        every timestep. The block covers the whole simulation unless that would exceed maxBytes, in which case
+        the next block is drawn once the current one has been used up.
+
+        Params:
+            - maxBytes (int) [optional]: the maximum size of the noise buffer in bytes. By default 256 MB
+
+        Returns:
+            No return.
+        """
+        bytesPerTimestep = self.numberOfParticles * self._dim * np.dtype(np.float32).itemsize
+        blockLength = max(1, min(self.numIntervals, maxBytes // bytesPerTimestep))
+        self._noiseBuffer = np.empty((blockLength, self.numberOfParticles, self._dim), dtype=np.float32)
+        self.drawNoiseBlock(0)
+
+    def drawNoiseBlock(self, startTimestep):
+        """
+        Fills the noise buffer with the noise for the timesteps starting at startTimestep.
+
+        Params:
+            - startTimestep (int): the first timestep covered by the new block
+
+        Returns:
+            No return.
+        """
+        self._rng.standard_normal(dtype=np.float32, out=self._noiseBuffer)
+        self._noiseBuffer *= self.noise
+        self._noiseBlockStart = startTimestep
+
+    def generateNoise(self):
+        """
+        Generates some noise based on the noise amplitude set at creation.
+
+        Params:
+            None
+
+        Returns:
+            An array with the noise to be added to each individual
+        """
+        offset = self.t - self._noiseBlockStart
+        if offset >= len(self._noiseBuffer):
+            self.drawNoiseBlock(self.t)
+            offset = 0
+        return self._noiseBuffer[offset]
+
+    def updatePositions(self, positions, orientations, speeds):
+        """
+        Moves every individual along its orientation and wraps it around the periodic domain. The positions are 
+        updated in place and the velocities are computed in a buffer that is reused at every timestep.
+
+        Params:
+            - positions (array of floats): the position of every individual at the current timestep
+            - orientations (array of floats): the orientation of every individual after the current timestep
+            - speeds (array of floats): the speed of every individual
+
+        Returns:
+            The updated positions.
+        """
+        np.multiply(orientations, np.asarray(speeds)[:, np.newaxis], out=self._velocityBuffer)
+        self._velocityBuffer *= self.dt
+        positions += self._velocityBuffer
+        # nobody moves further than the size of the domain in a single timestep
+        np.subtract(positions, self._domain, out=positions, where=positions >= self._domain)
+        np.add(positions, self._domain, out=positions, where=positions < 0)
+        return positions
+
+    def createHistory(self, name, shape, dtype=np.float32):
+        """
+        Allocates the buffer for the history of a value. If a historyPath has been set, the buffer is a 
+        memory-mapped .npy file so that long runs do not need to keep the whole history in memory.
+
+        Params:
+            - name (string): the name of the value, used as the suffix of the file
+            - shape (tuple of ints): the shape of the history
+            - dtype (numpy dtype) [optional]: the type of the values. By default float32
+
+        Returns:
+            A zero-initialised array or memory map of the given shape.
+        """
+        if self.historyPath:
+            return np.lib.format.open_memmap(f"{self.historyPath}_{name}.npy", mode="w+", dtype=dtype, shape=shape)
+        return np.zeros(shape, dtype=dtype)
@@ -1,19 +1,24 @@
 import pandas as pd
 import numpy as np
+from functools import partial
+from numba import njit, prange
+from scipy import sparse
 
 import services.ServiceOrientations as ServiceOrientations
 import services.ServiceVicsekHelper as ServiceVicsekHelper
 import services.ServiceMetric as ServiceMetric
 import services.ServiceThresholdEvaluation as ServiceThresholdEvaluation
 import services.ServiceSavedModel as ServiceSavedModel
+import services.ServiceVicsekGpu as ServiceVicsekGpu
 
 import model.SwitchInformation as SwitchInformation
+from model.SimulationMixin import SimulationMixin
 
-class VicsekWithNeighbourSelection():
+class VicsekWithNeighbourSelection(SimulationMixin):
 
     def __init__(self, domainSize, radius, noise, numberOfParticles,
                  speed=1, use_single_speed=True, vary_speed_throughout=False, degreesOfVision=2*np.pi, occlusion_active=False, 
-                 returnHistories=True, logPath=None, logInterval=1):
+                 returnHistories=True, logPath=None, logInterval=1, seed=None, historyPath=None, backend="cpu"):
         """
         Params:
             - domainSize (tuple of floats): the size of the domain
@@ -26,7 +31,12 @@ class VicsekWithNeighbourSelection():
             - activationTimeDelays (array of int) [optional]: how often each individual updates its orientation
             - isActivationTimeDelayRelevantForEvents (boolean) [optional]: whether an individual should also ignore events when it is not ready to update its orientation
             - colourType (ColourType) [optional]: if and how individuals should be coloured for future rendering
+            - seed (int) [optional]: the seed of the random number generator used during the simulation
+            - historyPath (string) [optional]: if set, the histories are written to memory-mapped .npy files starting with this path instead of being kept in memory
+            - backend (string) [optional]: "cpu" or "gpu". The gpu backend requires CuPy and is only used for 2D domains without occlusion. By default "cpu"
         """
+        if backend == "gpu" and not ServiceVicsekGpu.isAvailable():
+            raise Exception("The gpu backend requires CuPy to be installed")
 
         self.domainSize = np.asarray(domainSize)
         self.radius = radius
@@ -41,6 +51,14 @@ class VicsekWithNeighbourSelection():
         self.returnHistories = returnHistories
         self.logPath = logPath
         self.logInterval = logInterval
+        self.historyPath = historyPath
+        self.backend = backend
+        self.seed = seed
+
+        # SFC64 draws the normally distributed noise faster than the default PCG64
+        self._rng = np.random.Generator(np.random.SFC64(seed))
+
+        self._parameterSummary = None
 
 
     def getParameterSummary(self, asString=False):
@@ -53,6 +71,9 @@ class VicsekWithNeighbourSelection():
         Returns:
             A dictionary or a single string containing all model parameters.
         """
+        # the summary only changes when a new simulation is prepared
+        if self._parameterSummary != None:
+            return self._parameterSummaryString if asString else self._parameterSummary
         summary = {"n": self.numberOfParticles,
                     "noise": self.noise,
                     "radius": self.radius,
@@ -64,9 +85,10 @@ class VicsekWithNeighbourSelection():
                     "use_single_speed": self.use_single_speed
                     }
         
+        self._parameterSummary = summary
+        self._parameterSummaryString = ", ".join([f"{key}: {value}" for key, value in summary.items()])
         if asString:
-            strPrep = [tup[0] + ": " + tup[1] for tup in summary.values()]
-            return ", ".join(strPrep)
+            return self._parameterSummaryString
         return summary
 
 
@@ -80,30 +102,75 @@ class VicsekWithNeighbourSelection():
         Returns:
             Arrays of positions and orientations containing values for every individual within the system
         """
-        positions = self.domainSize*np.random.rand(self.numberOfParticles,len(self.domainSize))
-        orientations = ServiceOrientations.normalizeOrientations(np.random.rand(self.numberOfParticles, len(self.domainSize))-0.5)
+        positions = self.domainSize*self._rng.random((self.numberOfParticles,len(self.domainSize)), dtype=np.float32)
+        orientations = ServiceOrientations.normalizeOrientations(self._rng.random((self.numberOfParticles, len(self.domainSize)), dtype=np.float32)-0.5)
 
         return positions, orientations
   
-    def generateNoise(self):
+    def generateSpeeds(self, speeds):
+        if self.vary_speed_throughout == False:
+            return speeds
+        if self.use_single_speed:
+            return self.generateSingleSpeed(speeds)
+        return self.generateIndividualSpeeds(speeds)
+    
+    def generateSingleSpeed(self, speeds):
+        speed = self._rng.normal(self.speed, self.noise, 1)
+        return np.full(self.numberOfParticles, speed, dtype=np.float32)
+    
+    def generateIndividualSpeeds(self, speeds):
+        return self._rng.normal(self.speed, scale=self.noise, size=self.numberOfParticles).astype(np.float32)
+    
+    def resolveStepFunctions(self):
         """
-        Generates some noise based on the noise amplitude set at creation.
+        Resolves the functions that are called at every timestep. The vision and speed settings do not change 
+        during a run, so the choice is made once before the simulation rather than at every timestep.
 
         Params:
             None
 
         Returns:
-            An array with the noise to be added to each individual
+            The function computing the neighbours (None if the compiled step is used) and the function updating the speeds (None if the speeds stay constant).
         """
-        return np.random.normal(scale=self.noise, size=(self.numberOfParticles, len(self.domainSize)))
-    
-    def generateSpeeds(self, speeds):
+        if not self.useCompiledStep():
+            # occlusion and domains that are not 2D are not supported by the compiled step, so the neighbours 
+            # are determined from the pairs within the radius instead
+            neighbourFunction = partial(ServiceVicsekHelper.getNeighbourIndicesWithLimitedVision, domainSize=self.domainSize, radius=self.radius, 
+                                        fov=self.degreesOfVision, occlusion_active=self.occlusion_active)
+        else:
+            # the compiled step determines the neighbours itself
+            neighbourFunction = None
         if self.vary_speed_throughout == False:
-            return speeds
-        if self.use_single_speed:
-            speed = np.random.normal(self.speed, self.noise, 1)
-            return np.full(self.numberOfParticles, speed)
-        return np.random.normal(self.speed, scale=self.noise, size=self.numberOfParticles)
+            speedFunction = None
+        elif self.use_single_speed:
+            speedFunction = self.generateSingleSpeed
+        else:
+            speedFunction = self.generateIndividualSpeeds
+        return neighbourFunction, speedFunction
+
+    def useCompiledStep(self):
+        """
+        Checks if the timesteps can be computed by the compiled kernel, i.e. if the domain is 2D and there is no occlusion.
+
+        Params:
+            None
+
+        Returns:
+            A boolean representing whether the compiled kernel is used.
+        """
+        return len(self.domainSize) == 2 and not self.occlusion_active
+
+    def useGpu(self):
+        """
+        Checks if the timesteps are computed on the GPU, i.e. if the gpu backend has been selected and the compiled kernel can be used.
+
+        Params:
+            None
+
+        Returns:
+            A boolean representing whether the GPU is used.
+        """
+        return self.backend == "gpu" and self.useCompiledStep()
 
     def calculateMeanOrientations(self, orientations, neighbours):
         """
@@ -111,13 +178,30 @@ class VicsekWithNeighbourSelection():
 
         Params:
             - orientations (array of floats): the orientation of every individual at the current timestep
-            - neighbours (array of arrays of booleans): the identity of every neighbour of every individual
+            - neighbours (tuple of arrays of ints): the indices of the neighbours of all individuals and the index at which the neighbours of every individual start (see ServiceVicsekHelper.getNeighbourIndicesWithLimitedVision())
 
         Returns:
             An array of floats containing the new, normalised orientations of every individual
         """
-        summedOrientations = np.sum(neighbours[:,:,np.newaxis]*orientations[np.newaxis,:,:],axis=1)
-        return ServiceOrientations.normalizeOrientations(summedOrientations)
+        return ServiceOrientations.normalizeOrientations(self.calculateSummedOrientations(orientations, neighbours))
+
+    def calculateSummedOrientations(self, orientations, neighbours):
+        """
+        Computes the sum of the orientations of all selected neighbours for every individual.
+
+        Params:
+            - orientations (array of floats): the orientation of every individual at the current timestep
+            - neighbours (tuple of arrays of ints): the indices of the neighbours of all individuals and the index at which the neighbours of every individual start (see ServiceVicsekHelper.getNeighbourIndicesWithLimitedVision())
+
+        Returns:
+            An array of floats containing the summed orientations of every individual
+        """
+        neighbourIndices, starts = neighbours
+        # only a small fraction of all pairs are neighbours, so the sum is a sparse matrix-vector product
+        numberOfIndividuals = len(orientations)
+        adjacency = sparse.csr_matrix((np.ones(len(neighbourIndices), dtype=orientations.dtype), neighbourIndices, np.append(starts, len(neighbourIndices))), 
+                                      shape=(numberOfIndividuals, numberOfIndividuals))
+        return adjacency @ orientations
 
     def computeNewOrientations(self, neighbours, orientations):
         """
@@ -126,7 +210,7 @@ class VicsekWithNeighbourSelection():
         Also sets the colours for ColourType.EXAMPLE.
 
         Params:
-            - neighbours (array of arrays of booleans): the identity of every neighbour of every individual
+            - neighbours (tuple of arrays of ints): the indices of the neighbours of all individuals and the index at which the neighbours of every individual start
             - positions (array of floats): the position of every individual at the current timestep
             - orientations (array of floats): the orientation of every individual at the current timestep
             - nsms (array of NeighbourSelectionMechanism): the neighbour selection mechanism used by every individual at the current timestep
@@ -136,11 +220,8 @@ class VicsekWithNeighbourSelection():
         Returns:
             An array of floats representing the orientations of all individuals after the current timestep
         """
-
-        oldOrientations = np.copy(orientations)
-
-        orientations = self.calculateMeanOrientations(orientations, neighbours)
-        orientations = ServiceOrientations.normalizeOrientations(orientations+self.generateNoise())
+        orientations = self.calculateSummedOrientations(orientations, neighbours)
+        _normaliseWithNoise(orientations, self.generateNoise(), orientations)
         
         return orientations
     
@@ -158,12 +239,21 @@ class VicsekWithNeighbourSelection():
         """
          # Preparations and setting of parameters if they are not passed to the method
         
+        self._parameterSummary = None
         if any(ele is None for ele in initialState):
             positions, orientations = self.initializeState()
         else:
             positions, orientations = initialState
 
-        speeds = np.full(self.numberOfParticles, self.speed)
+        # single precision is sufficient for the model and halves the memory traffic
+        positions = np.asarray(positions, dtype=np.float32)
+        orientations = np.asarray(orientations, dtype=np.float32)
+
+        # the dimensionality and the domain in the type of the positions are needed at every timestep
+        self._dim = len(self.domainSize)
+        self._domain = np.asarray(self.domainSize, dtype=positions.dtype)
+
+        speeds = np.full(self.numberOfParticles, self.speed, dtype=np.float32)
         speeds = self.generateSpeeds(speeds)
 
         #print(f"t=pre, order={ServiceMetric.computeGlobalOrder(orientations)}")
@@ -180,14 +270,20 @@ class VicsekWithNeighbourSelection():
 
         # Initialisations for the loop and the return variables
         self.numIntervals=int(tmax/dt+1)
+        if not self.useGpu():
+            # the GPU draws its own noise on the device
+            self.prepareNoise()
+        self._velocityBuffer = np.empty((self.numberOfParticles, self._dim), dtype=np.float32)
 
-        self.thresholdEvaluationChoiceValuesHistory = []  
         if self.returnHistories:
-            self.positionsHistory = np.zeros((self.numIntervals,self.numberOfParticles,len(self.domainSize)))
-            self.orientationsHistory = np.zeros((self.numIntervals,self.numberOfParticles,len(self.domainSize)))  
+            self.positionsHistory = self.createHistory("positions", (self.numIntervals,self.numberOfParticles,self._dim))
+            self.orientationsHistory = self.createHistory("orientations", (self.numIntervals,self.numberOfParticles,self._dim))
 
             self.positionsHistory[0,:,:]=positions
             self.orientationsHistory[0,:,:]=orientations
+        else:
+            self.positionsHistory = None
+            self.orientationsHistory = None
 
         return positions, orientations, speeds
 
@@ -220,6 +316,15 @@ class VicsekWithNeighbourSelection():
         """
        
         positions, orientations, speeds = self.prepareSimulation(initialState=initialState, dt=dt, tmax=tmax)
+        getNeighbours, generateSpeeds = self.resolveStepFunctions()
+        if self.useGpu():
+            return self.simulateOnGpu(positions, orientations, speeds, generateSpeeds)
+        if getNeighbours == None:
+            positions = np.ascontiguousarray(positions)
+            # the orientations alternate between two buffers so that the initial state is left untouched
+            orientations, newOrientations = np.array(orientations), np.empty((self.numberOfParticles, 2), dtype=np.float32)
+            cosHalfFov = np.cos(min(self.degreesOfVision, 2*np.pi) / 2)
+            Lx, Ly = float(self.domainSize[0]), float(self.domainSize[1])
 
         for t in range(self.numIntervals):
             self.t = t
@@ -228,16 +333,21 @@ class VicsekWithNeighbourSelection():
             # if self.t % 100 == 0:
             #     print(f"{t}: {ServiceMetric.computeGlobalOrder(orientations)}")
 
-            # all neighbours (including self)
-            neighbours = ServiceVicsekHelper.getNeighboursWithLimitedVision(positions=positions, orientations=orientations, domainSize=self.domainSize,
-                                                                            radius=self.radius, fov=self.degreesOfVision, occlusion_active=self.occlusion_active)
+            if getNeighbours == None:
+                if generateSpeeds != None:
+                    speeds = generateSpeeds(speeds)
+                _step(positions, orientations, np.asarray(speeds, dtype=np.float32), self.generateNoise(), self.radius, cosHalfFov, self.dt, Lx, Ly, newOrientations)
+                orientations, newOrientations = newOrientations, orientations
+            else:
+                # all neighbours (including self)
+                neighbours = getNeighbours(positions=positions, orientations=orientations)
 
-            orientations = self.computeNewOrientations(neighbours, orientations)
+                orientations = self.computeNewOrientations(neighbours, orientations)
 
-            speeds = self.generateSpeeds(speeds)
+                if generateSpeeds != None:
+                    speeds = generateSpeeds(speeds)
 
-            positions += self.dt*(orientations.T * speeds).T
-            positions += -self.domainSize*np.floor(positions/self.domainSize)
+                positions = self.updatePositions(positions, orientations, speeds)
 
             self.updateHistoriesAndLogs(t=t,
                                         positions=positions,
@@ -247,3 +357,295 @@ class VicsekWithNeighbourSelection():
             #     print(f"t={t}, th={self.thresholdEvaluationMethod.name}, order={ServiceMetric.computeGlobalOrder(orientations)}")
 
         return (self.dt*np.arange(self.numIntervals), self.positionsHistory, self.orientationsHistory)
+
+    def simulateOnGpu(self, positions, orientations, speeds, generateSpeeds):
+        """
+        Runs the simulation on the GPU. The state stays on the device and the histories are copied to the host 
+        in blocks of logInterval timesteps rather than at every timestep.
+
+        Params:
+            - positions (array of floats): the initial position of every individual
+            - orientations (array of floats): the initial orientation of every individual
+            - speeds (array of floats): the initial speed of every individual
+            - generateSpeeds (function): the function that draws new speeds at every timestep or None
+
+        Returns:
+            (times, positionsHistory, orientationsHistory)
+        """
+        cp = ServiceVicsekGpu.cp
+        rng = cp.random.default_rng(self.seed)
+        positionsGpu = cp.asarray(positions, dtype=cp.float32)
+        orientationsGpu = cp.asarray(orientations, dtype=cp.float32)
+        newOrientationsGpu = cp.empty_like(orientationsGpu)
+        speedsGpu = cp.asarray(speeds, dtype=cp.float32)
+        noiseGpu = cp.empty_like(orientationsGpu)
+        cosHalfFov = np.cos(min(self.degreesOfVision, 2*np.pi) / 2)
+        Lx, Ly = float(self.domainSize[0]), float(self.domainSize[1])
+
+        blockLength = max(1, self.logInterval)
+        positionsBlock = cp.empty((blockLength, self.numberOfParticles, 2), dtype=cp.float32)
+        orientationsBlock = cp.empty((blockLength, self.numberOfParticles, 2), dtype=cp.float32)
+        blockStart = 0
+        for t in range(self.numIntervals):
+            self.t = t
+            if t % 1000 == 0:
+                print(f"t={t}/{self.tmax}")
+
+            if generateSpeeds != None:
+                speeds = generateSpeeds(speeds)
+                speedsGpu.set(np.asarray(speeds, dtype=np.float32))
+            rng.standard_normal(dtype=cp.float32, out=noiseGpu)
+            noiseGpu *= self.noise
+            ServiceVicsekGpu.step(positionsGpu, orientationsGpu, speedsGpu, noiseGpu, self.radius, cosHalfFov, self.dt, Lx, Ly, newOrientationsGpu)
+            orientationsGpu, newOrientationsGpu = newOrientationsGpu, orientationsGpu
+
+            positionsBlock[t - blockStart] = positionsGpu
+            orientationsBlock[t - blockStart] = orientationsGpu
+            if t - blockStart + 1 == blockLength or t == self.numIntervals - 1:
+                blockEnd = t + 1
+                if self.returnHistories:
+                    positionsBlock[:blockEnd - blockStart].get(out=self.positionsHistory[blockStart:blockEnd])
+                    orientationsBlock[:blockEnd - blockStart].get(out=self.orientationsHistory[blockStart:blockEnd])
+                if self.logPath:
+                    # blocks start at multiples of the log interval
+                    ServiceSavedModel.saveModelTimestep(timestep=blockStart, 
+                                                        positions=positionsBlock[0].get(), 
+                                                        orientations=orientationsBlock[0].get(),
+                                                        path=self.logPath,
+                                                        switchValues=None,
+                                                        switchingActive=False)
+                blockStart = blockEnd
+
+        return (self.dt*np.arange(self.numIntervals), self.positionsHistory, self.orientationsHistory)
+
+
+def runBatch(simulators, initialStates, dt=None, tmax=None, maxBytes=256*1024**2):
+    """
+    Runs several simulations that share the number of particles, the domain and the number of timesteps at once. 
+    The simulations without occlusion only differ in scalar parameters and are therefore stepped together by a 
+    single parallel kernel, one simulation per thread. Simulations with occlusion, on the GPU, with logging or 
+    without histories are run one after the other. The batch is stepped through blocks of timesteps so that the 
+    speeds, noise and histories of a block stay within maxBytes before they are written into the histories of 
+    the simulators.
+
+    Params:
+        - simulators (list of VicsekWithNeighbourSelection): the simulators to run
+        - initialStates (list of tuples of arrays): the initial positions and orientations for every simulator
+        - dt (int) [optional]: time step
+        - tmax (int) [optional]: the total number of time steps of the experiment
+        - maxBytes (int) [optional]: the maximum size of the buffers of a block of timesteps in bytes. By default 256 MB
+
+    Returns:
+        A list containing (times, positionsHistory, orientationsHistory) for every simulator, in the same order as the simulators.
+    """
+    results = [None] * len(simulators)
+    batch = []
+    for index, (simulator, initialState) in enumerate(zip(simulators, initialStates)):
+        if simulator.occlusion_active or simulator.useGpu() or simulator.logPath or not simulator.returnHistories:
+            results[index] = simulator.simulate(initialState=initialState, dt=dt, tmax=tmax)
+        else:
+            batch.append(index)
+    if len(batch) == 0:
+        return results
+
+    batchSimulators = [simulators[index] for index in batch]
+    prepared = [simulator.prepareSimulation(initialState=initialStates[index], dt=dt, tmax=tmax) for simulator, index in zip(batchSimulators, batch)]
+    if len({(s.numIntervals, s.numberOfParticles, tuple(s.domainSize)) for s in batchSimulators}) > 1:
+        raise Exception("All simulations in a batch need to share the number of particles, the domain size and the number of timesteps")
+
+    first = batchSimulators[0]
+    numberOfSimulations, numIntervals, n = len(batch), first.numIntervals, first.numberOfParticles
+    positions = np.array([simulatorPositions for simulatorPositions, _, _ in prepared], dtype=np.float32)
+    orientations = np.array([simulatorOrientations for _, simulatorOrientations, _ in prepared], dtype=np.float32)
+    currentSpeeds = [simulatorSpeeds for _, _, simulatorSpeeds in prepared]
+    generateSpeeds = [simulator.resolveStepFunctions()[1] for simulator in batchSimulators]
+
+    # the speeds, the noise and both histories of every simulation for a single timestep
+    bytesPerTimestep = numberOfSimulations * n * 7 * np.dtype(np.float32).itemsize
+    blockLength = max(1, min(numIntervals, maxBytes // bytesPerTimestep))
+    speeds = np.empty((numberOfSimulations, blockLength, n), dtype=np.float32)
+    noise = np.empty((numberOfSimulations, blockLength, n, 2), dtype=np.float32)
+    positionsBlock = np.empty((numberOfSimulations, blockLength, n, 2), dtype=np.float32)
+    orientationsBlock = np.empty((numberOfSimulations, blockLength, n, 2), dtype=np.float32)
+    radii = np.array([s.radius for s in batchSimulators], dtype=np.float64)
+    cosHalfFovs = np.array([np.cos(min(s.degreesOfVision, 2*np.pi) / 2) for s in batchSimulators])
+    dts = np.array([s.dt for s in batchSimulators], dtype=np.float64)
+    Lx, Ly = float(first.domainSize[0]), float(first.domainSize[1])
+
+    for blockStart in range(0, numIntervals, blockLength):
+        blockEnd = min(blockStart + blockLength, numIntervals)
+        length = blockEnd - blockStart
+        for c, simulator in enumerate(batchSimulators):
+            # the speeds and noise are drawn in the same order as during simulate() so that the results match
+            for t in range(blockStart, blockEnd):
+                simulator.t = t
+                if generateSpeeds[c] != None:
+                    currentSpeeds[c] = generateSpeeds[c](currentSpeeds[c])
+                speeds[c, t - blockStart] = currentSpeeds[c]
+                noise[c, t - blockStart] = simulator.generateNoise()
+        # the positions and orientations carry the state over from one block to the next
+        _simulateBatch(positions, orientations, speeds[:, :length], noise[:, :length], radii, cosHalfFovs, dts, Lx, Ly, 
+                       positionsBlock[:, :length], orientationsBlock[:, :length])
+        # the histories are written into the buffers of prepareSimulation(), which may be memory-mapped files
+        for c, simulator in enumerate(batchSimulators):
+            simulator.positionsHistory[blockStart:blockEnd] = positionsBlock[c, :length]
+            simulator.orientationsHistory[blockStart:blockEnd] = orientationsBlock[c, :length]
+
+    for index, simulator in zip(batch, batchSimulators):
+        results[index] = (simulator.dt*np.arange(simulator.numIntervals), simulator.positionsHistory, simulator.orientationsHistory)
+    return results
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _step(positions, orientations, speeds, noise, radius, cosHalfFov, dt, Lx, Ly, newOrientations):
+    """
+    Computes a single timestep of a 2D simulation without occlusion. The neighbours are found with a cell list 
+    and the individuals are distributed across threads. The neighbourhood and field of vision follow 
+    ServiceVicsekHelper.getNeighboursWithLimitedVision().
+
+    Params:
+        - positions (array of floats): the position of every individual. Updated in place
+        - orientations (array of floats): the orientation of every individual at the current timestep
+        - speeds (array of floats): the speed of every individual
+        - noise (array of floats): the noise added to the orientation of every individual
+        - radius (float): the perception radius of the individuals
+        - cosHalfFov (float): the cosine of half the field of vision
+        - dt (float): the difference between the timesteps
+        - Lx (float): the size of the domain along the x-axis
+        - Ly (float): the size of the domain along the y-axis
+        - newOrientations (array of floats): the array that the orientations after the timestep are written into
+
+    Returns:
+        Nothing. The results are written into positions and newOrientations.
+    """
+    n = positions.shape[0]
+    nx, ny, cellStarts, sortedIndices = ServiceVicsekHelper.getCellList(positions, radius, Lx, Ly)
+    for i in prange(n):
+        sx, sy = _sumVisibleOrientations(i, positions, orientations, radius * radius, cosHalfFov, Lx, Ly, nx, ny, cellStarts, sortedIndices)
+        norm = np.sqrt(sx*sx + sy*sy)
+        ux = sx / norm + noise[i, 0]
+        uy = sy / norm + noise[i, 1]
+        norm = np.sqrt(ux*ux + uy*uy)
+        newOrientations[i, 0] = ux / norm
+        newOrientations[i, 1] = uy / norm
+    for i in prange(n):
+        positions[i, 0] += dt * (newOrientations[i, 0] * speeds[i])
+        positions[i, 1] += dt * (newOrientations[i, 1] * speeds[i])
+        positions[i, 0] = ServiceVicsekHelper.wrapCoordinate(positions[i, 0], Lx)
+        positions[i, 1] = ServiceVicsekHelper.wrapCoordinate(positions[i, 1], Ly)
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _normaliseWithNoise(summedOrientations, noise, out):
+    """
+    Normalises the summed orientations, adds the noise and normalises again in a single pass over the individuals.
+
+    Params:
+        - summedOrientations (array of floats): the summed orientations of the neighbours of every individual
+        - noise (array of floats): the noise added to the orientation of every individual
+        - out (array of floats): the array that the new orientations are written into. May be summedOrientations
+
+    Returns:
+        Nothing. The results are written into out.
+    """
+    n, d = summedOrientations.shape
+    for i in prange(n):
+        norm = 0.0
+        for j in range(d):
+            norm += summedOrientations[i, j] * summedOrientations[i, j]
+        norm = np.sqrt(norm)
+        noisyNorm = 0.0
+        for j in range(d):
+            out[i, j] = summedOrientations[i, j] / norm + noise[i, j]
+            noisyNorm += out[i, j] * out[i, j]
+        noisyNorm = np.sqrt(noisyNorm)
+        for j in range(d):
+            out[i, j] /= noisyNorm
+
+@njit(fastmath=True, cache=True)
+def _sumVisibleOrientations(i, positions, orientations, radiusSquared, cosHalfFov, Lx, Ly, nx, ny, cellStarts, sortedIndices):
+    """
+    Sums the orientations of all individuals that individual i can see (including itself), searching only the 
+    cells surrounding it. The neighbourhood and field of vision follow ServiceVicsekHelper.getNeighboursWithLimitedVision().
+
+    Params:
+        - i (int): the index of the individual
+        - positions (array of floats): the position of every individual
+        - orientations (array of floats): the orientation of every individual
+        - radiusSquared (float): the squared perception radius of the individuals
+        - cosHalfFov (float): the cosine of half the field of vision
+        - Lx (float): the size of the domain along the x-axis
+        - Ly (float): the size of the domain along the y-axis
+        - nx, ny, cellStarts, sortedIndices: the cell list as returned by ServiceVicsekHelper.getCellList()
+
+    Returns:
+        The x- and y-component of the summed orientations.
+    """
+    cx = min(max(int(positions[i, 0] / Lx * nx), 0), nx - 1)
+    cy = min(max(int(positions[i, 1] / Ly * ny), 0), ny - 1)
+    sx = 0.0
+    sy = 0.0
+    for neighbourCx in ServiceVicsekHelper.getSurroundingCells(cx, nx):
+        for neighbourCy in ServiceVicsekHelper.getSurroundingCells(cy, ny):
+            cell = neighbourCx*ny + neighbourCy
+            for index in range(cellStarts[cell], cellStarts[cell + 1]):
+                j = sortedIndices[index]
+                if j != i:
+                    # the field of vision is determined without the periodic boundaries
+                    dx = positions[j, 0] - positions[i, 0]
+                    dy = positions[j, 1] - positions[i, 1]
+                    distanceSquared = dx*dx + dy*dy
+                    if distanceSquared == 0 or distanceSquared > radiusSquared:
+                        continue
+                    # a full field of vision sees everything, even if the orientation is not exactly of unit length
+                    if cosHalfFov > -1 and dx*orientations[i, 0] + dy*orientations[i, 1] < cosHalfFov * np.sqrt(distanceSquared):
+                        continue
+                sx += orientations[j, 0]
+                sy += orientations[j, 1]
+    return sx, sy
+
+@njit(parallel=True, cache=True)
+def _simulateBatch(positions, orientations, speeds, noise, radii, cosHalfFovs, dts, Lx, Ly, positionsHistory, orientationsHistory):
+    """
+    Steps several 2D simulations without occlusion through a block of timesteps. Every simulation is handled by its 
+    own thread and the neighbours are found with a cell list. The neighbourhood and field of vision follow ServiceVicsekHelper.getNeighboursWithLimitedVision().
+
+    Params:
+        - positions (array of floats): the initial positions of shape (C, N, 2). Updated in place
+        - orientations (array of floats): the initial orientations of shape (C, N, 2). Updated in place
+        - speeds (array of floats): the speed of every individual at every timestep of the block of shape (C, T, N)
+        - noise (array of floats): the noise added to every orientation at every timestep of the block of shape (C, T, N, 2)
+        - radii (array of floats): the perception radius for every simulation
+        - cosHalfFovs (array of floats): the cosine of half the field of vision for every simulation
+        - dts (array of floats): the time step for every simulation
+        - Lx (float): the size of the domain along the x-axis
+        - Ly (float): the size of the domain along the y-axis
+        - positionsHistory (array of floats): the array of shape (C, T, N, 2) that the positions are written into
+        - orientationsHistory (array of floats): the array of shape (C, T, N, 2) that the orientations are written into
+
+    Returns:
+        Nothing. The results are written into positionsHistory and orientationsHistory.
+    """
+    numberOfSimulations, numberOfTimesteps, n = speeds.shape
+    for c in prange(numberOfSimulations):
+        pos = positions[c]
+        orient = orientations[c]
+        summed = np.empty((n, 2))
+        radiusSquared = radii[c] * radii[c]
+        for t in range(numberOfTimesteps):
+            nx, ny, cellStarts, sortedIndices = ServiceVicsekHelper.getCellList(pos, radii[c], Lx, Ly)
+            for i in range(n):
+                sx, sy = _sumVisibleOrientations(i, pos, orient, radiusSquared, cosHalfFovs[c], Lx, Ly, nx, ny, cellStarts, sortedIndices)
+                summed[i, 0] = sx
+                summed[i, 1] = sy
+            for i in range(n):
+                norm = np.sqrt(summed[i, 0]**2 + summed[i, 1]**2)
+                ux = summed[i, 0] / norm + noise[c, t, i, 0]
+                uy = summed[i, 1] / norm + noise[c, t, i, 1]
+                norm = np.sqrt(ux**2 + uy**2)
+                orient[i, 0] = ux / norm
+                orient[i, 1] = uy / norm
+                pos[i, 0] += dts[c] * (orient[i, 0] * speeds[c, t, i])
+                pos[i, 1] += dts[c] * (orient[i, 1] * speeds[c, t, i])
+                pos[i, 0] = ServiceVicsekHelper.wrapCoordinate(pos[i, 0], Lx)
+                pos[i, 1] = ServiceVicsekHelper.wrapCoordinate(pos[i, 1], Ly)
+            positionsHistory[c, t] = pos
+            orientationsHistory[c, t] = orient
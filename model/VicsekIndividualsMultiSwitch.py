@@ -13,14 +13,15 @@ import services.ServiceThresholdEvaluation as ServiceThresholdEvaluation
 import services.ServiceSavedModel as ServiceSavedModel
 
 import model.SwitchInformation as SwitchInformation
+from model.SimulationMixin import SimulationMixin
 
-class VicsekWithNeighbourSelection():
+class VicsekWithNeighbourSelection(SimulationMixin):
 
     def __init__(self, domainSize, radius, noise, numberOfParticles, k, neighbourSelectionMechanism,
                  speed=1, switchSummary=None, events=None, degreesOfVision=2*np.pi, 
                  activationTimeDelays=[], isActivationTimeDelayRelevantForEvents=False, colourType=None, 
                  thresholdEvaluationMethod=ThresholdEvaluationMethod.LOCAL_ORDER, updateIfNoNeighbours=True,
-                 returnHistories=True, logPath=None, logInterval=1):
+                 returnHistories=True, logPath=None, logInterval=1, seed=None, historyPath=None):
         """
         Params:
             - domainSize (tuple of floats): the size of the domain
@@ -36,6 +37,8 @@ class VicsekWithNeighbourSelection():
             - activationTimeDelays (array of int) [optional]: how often each individual updates its orientation
             - isActivationTimeDelayRelevantForEvents (boolean) [optional]: whether an individual should also ignore events when it is not ready to update its orientation
             - colourType (ColourType) [optional]: if and how individuals should be coloured for future rendering
+            - seed (int) [optional]: the seed of the random number generator used during the simulation
+            - historyPath (string) [optional]: if set, the histories are written to memory-mapped .npy files starting with this path instead of being kept in memory
         """
 
         self.domainSize = np.asarray(domainSize)
@@ -58,6 +61,12 @@ class VicsekWithNeighbourSelection():
         self.returnHistories = returnHistories
         self.logPath = logPath
         self.logInterval = logInterval
+        self.historyPath = historyPath
+
+        # SFC64 draws the normally distributed noise faster than the default PCG64
+        self._rng = np.random.Generator(np.random.SFC64(seed))
+
+        self._parameterSummary = None
 
         # Preparation of constants
         self.minReplacementValue = -1
@@ -75,6 +84,9 @@ class VicsekWithNeighbourSelection():
         Returns:
             A dictionary or a single string containing all model parameters.
         """
+        # the summary only changes when a new simulation is prepared
+        if self._parameterSummary != None:
+            return self._parameterSummaryString if asString else self._parameterSummary
         summary = {"n": self.numberOfParticles,
                     "k": self.k,
                     "noise": self.noise,
@@ -102,9 +114,10 @@ class VicsekWithNeighbourSelection():
                 eventsSummary.append(event.getParameterSummary())
             summary["events"] = eventsSummary
 
+        self._parameterSummary = summary
+        self._parameterSummaryString = ", ".join([f"{key}: {value}" for key, value in summary.items()])
         if asString:
-            strPrep = [tup[0] + ": " + tup[1] for tup in summary.values()]
-            return ", ".join(strPrep)
+            return self._parameterSummaryString
         return summary
 
 
@@ -118,8 +131,8 @@ class VicsekWithNeighbourSelection():
         Returns:
             Arrays of positions and orientations containing values for every individual within the system
         """
-        positions = self.domainSize*np.random.rand(self.numberOfParticles,len(self.domainSize))
-        orientations = ServiceOrientations.normalizeOrientations(np.random.rand(self.numberOfParticles, len(self.domainSize))-0.5)
+        positions = self.domainSize*self._rng.random((self.numberOfParticles,len(self.domainSize)), dtype=np.float32)
+        orientations = ServiceOrientations.normalizeOrientations(self._rng.random((self.numberOfParticles, len(self.domainSize)), dtype=np.float32)-0.5)
 
         return positions, orientations
     
@@ -140,7 +153,7 @@ class VicsekWithNeighbourSelection():
         nsms = np.array(nsmsDf["nsms"])
 
         ks = np.array(self.numberOfParticles * [self.k])
-        speeds = np.full(self.numberOfParticles, self.speed)
+        speeds = np.full(self.numberOfParticles, self.speed, dtype=np.float32)
 
         activationTimeDelays = np.ones(self.numberOfParticles)
 
@@ -163,18 +176,6 @@ class VicsekWithNeighbourSelection():
 
         return nsms, ks, speeds, activationTimeDelays
 
-    def generateNoise(self):
-        """
-        Generates some noise based on the noise amplitude set at creation.
-
-        Params:
-            None
-
-        Returns:
-            An array with the noise to be added to each individual
-        """
-        return np.random.normal(scale=self.noise, size=(self.numberOfParticles, len(self.domainSize)))
-
     def calculateMeanOrientations(self, orientations, neighbours):
         """
         Computes the average of the orientations of all selected neighbours for every individual.
@@ -186,7 +187,7 @@ class VicsekWithNeighbourSelection():
         Returns:
             An array of floats containing the new, normalised orientations of every individual
         """
-        summedOrientations = np.sum(neighbours[:,:,np.newaxis]*orientations[np.newaxis,:,:],axis=1)
+        summedOrientations = neighbours.astype(orientations.dtype) @ orientations
         return ServiceOrientations.normalizeOrientations(summedOrientations)
     
     def __getPickedNeighbourIndices(self, sortedIndices, kMaxPresent, ks):
@@ -355,8 +356,7 @@ class VicsekWithNeighbourSelection():
         kMax = np.max(ks)
         
         candidateIndices = ServiceVicsekHelper.getIndicesForTrueValues(neighbours, paddingType='repetition')
-        rng = np.random.default_rng()
-        rng.shuffle(candidateIndices, axis=1)
+        self._rng.shuffle(candidateIndices, axis=1)
         if self.switchSummary != None and self.switchSummary.isActive(SwitchType.K):
             kMin, kMax = self.switchSummary.getMinMaxValuesForKSwitchIfPresent()
             if len(candidateIndices[0]) < kMax:
@@ -443,10 +443,12 @@ class VicsekWithNeighbourSelection():
 
         np.fill_diagonal(pickedNeighbours, True)
 
-        oldOrientations = np.copy(orientations)
+        # the averaging below creates a new array, so the current orientations remain unchanged without a copy
+        oldOrientations = orientations
 
         orientations = self.calculateMeanOrientations(orientations, pickedNeighbours)
-        orientations = ServiceOrientations.normalizeOrientations(orientations+self.generateNoise())
+        orientations += self.generateNoise()
+        orientations = ServiceOrientations.normalizeOrientations(orientations)
         
         orientations = ServiceVicsekHelper.revertTimeDelayedChanges(self.t, oldOrientations, orientations, activationTimeDelays)
 
@@ -486,11 +488,31 @@ class VicsekWithNeighbourSelection():
             updatedSwitchValues = np.where((neighbour_counts <= 1), switchTypeValues, updatedSwitchValues)
         return updatedSwitchValues
     
-    def appendSwitchValues(self, nsms, ks, speeds, activationTimeDelays):
+    def prepareSwitchValuesHistory(self):
+        """
+        Allocates the history of the switch type values for the initial values and every timestep, i.e. 
+        numIntervals + 1 entries for every active switch type.
+
+        Params:
+            None
+
+        Returns:
+            Nothing.
         """
-        Appends all relevant switch type values to the history.
+        self.switchTypeValuesHistory = {'nsms': [], 'ks': [], 'speeds': [], 'activationTimeDelays': []}
+        if self.switchSummary == None:
+            return
+        for key, switchType in [('nsms', SwitchType.NEIGHBOUR_SELECTION_MECHANISM), ('ks', SwitchType.K), 
+                                ('speeds', SwitchType.SPEED), ('activationTimeDelays', SwitchType.ACTIVATION_TIME_DELAY)]:
+            if self.switchSummary.isActive(switchType):
+                self.switchTypeValuesHistory[key] = (self.numIntervals + 1) * [None]
+
+    def storeSwitchValues(self, index, nsms, ks, speeds, activationTimeDelays):
+        """
+        Stores all relevant switch type values in the history.
 
         Params:
+            - index (int): the position in the history. 0 for the initial values, t+1 for the values after timestep t
             - nsms (array of NeighbourSelectionMechanism): how each individual selects its neighbours
             - ks (array of ints): how many neighbours each individual considers
             - speeds (array of floats): how fast each agent moves
@@ -502,13 +524,13 @@ class VicsekWithNeighbourSelection():
         if self.switchSummary == None:
             return
         if self.switchSummary.isActive(SwitchType.NEIGHBOUR_SELECTION_MECHANISM):
-            self.switchTypeValuesHistory['nsms'].append(nsms)
+            self.switchTypeValuesHistory['nsms'][index] = nsms
         if self.switchSummary.isActive(SwitchType.K):
-            self.switchTypeValuesHistory['ks'].append(ks)
+            self.switchTypeValuesHistory['ks'][index] = ks
         if self.switchSummary.isActive(SwitchType.SPEED):
-            self.switchTypeValuesHistory['speeds'].append(speeds)
+            self.switchTypeValuesHistory['speeds'][index] = speeds
         if self.switchSummary.isActive(SwitchType.ACTIVATION_TIME_DELAY):
-            self.switchTypeValuesHistory['activationTimeDelays'].append(activationTimeDelays)
+            self.switchTypeValuesHistory['activationTimeDelays'][index] = activationTimeDelays
     
     def prepareSimulation(self, initialState, dt, tmax):
         """
@@ -524,11 +546,20 @@ class VicsekWithNeighbourSelection():
         """
          # Preparations and setting of parameters if they are not passed to the method
         
+        self._parameterSummary = None
         if any(ele is None for ele in initialState):
             positions, orientations = self.initializeState()
         else:
             positions, orientations = initialState
 
+        # single precision is sufficient for the model and halves the memory traffic
+        positions = np.asarray(positions, dtype=np.float32)
+        orientations = np.asarray(orientations, dtype=np.float32)
+
+        # the dimensionality and the domain in the type of the positions are needed at every timestep
+        self._dim = len(self.domainSize)
+        self._domain = np.asarray(self.domainSize, dtype=positions.dtype)
+
         nsms, ks, speeds, activationTimeDelays = self.initialiseSwitchingValues()
 
         #print(f"t=pre, order={ServiceMetric.computeGlobalOrder(orientations)}")
@@ -545,18 +576,24 @@ class VicsekWithNeighbourSelection():
 
         # Initialisations for the loop and the return variables
         self.numIntervals=int(tmax/dt+1)
+        self.prepareNoise()
+        self._velocityBuffer = np.empty((self.numberOfParticles, self._dim), dtype=np.float32)
 
-        self.thresholdEvaluationChoiceValuesHistory = []  
+        # the local orders are only needed to decide when to switch
+        if self.switchSummary != None:
+            self.thresholdEvaluationChoiceValuesHistory = np.zeros((self.numIntervals, self.numberOfParticles), dtype=np.float32)
+        else:
+            self.thresholdEvaluationChoiceValuesHistory = None
         if self.returnHistories:
-            self.positionsHistory = np.zeros((self.numIntervals,self.numberOfParticles,len(self.domainSize)))
-            self.orientationsHistory = np.zeros((self.numIntervals,self.numberOfParticles,len(self.domainSize)))  
-            self.switchTypeValuesHistory = {'nsms': [], 'ks': [], 'speeds': [], 'activationTimeDelays': []}
+            self.positionsHistory = self.createHistory("positions", (self.numIntervals,self.numberOfParticles,self._dim))
+            self.orientationsHistory = self.createHistory("orientations", (self.numIntervals,self.numberOfParticles,self._dim))
+            self.prepareSwitchValuesHistory()
             if self.colourType != None:
                 self.coloursHistory = self.numIntervals * [self.numberOfParticles * ['k']]
 
             self.positionsHistory[0,:,:]=positions
             self.orientationsHistory[0,:,:]=orientations
-            self.appendSwitchValues(nsms, ks, speeds, activationTimeDelays)
+            self.storeSwitchValues(0, nsms, ks, speeds, activationTimeDelays)
 
         return positions, orientations, nsms, ks, speeds, activationTimeDelays
     
@@ -587,7 +624,7 @@ class VicsekWithNeighbourSelection():
         if self.returnHistories:
             self.positionsHistory[t,:,:]=positions
             self.orientationsHistory[t,:,:]=orientations
-            self.appendSwitchValues(nsms, ks, speeds, activationTimeDelays)
+            self.storeSwitchValues(t+1, nsms, ks, speeds, activationTimeDelays)
             if self.colourType != None:
                 self.coloursHistory[t] = self.colours
         if self.logPath and t % self.logInterval == 0:
@@ -616,7 +653,10 @@ class VicsekWithNeighbourSelection():
        
         positions, orientations, nsms, ks, speeds, activationTimeDelays = self.prepareSimulation(initialState=initialState, dt=dt, tmax=tmax)
         if self.colourType == ColourType.EXAMPLE:
-            self.exampleId = np.random.choice(self.numberOfParticles, 1)
+            self.exampleId = self._rng.choice(self.numberOfParticles, 1)
+
+        # looked up once rather than at every timestep
+        domainSize = self.domainSize
         for t in range(self.numIntervals):
             self.t = t
             # if t % 5000 == 0:
@@ -625,16 +665,16 @@ class VicsekWithNeighbourSelection():
             #     print(f"{t}: {ServiceMetric.computeGlobalOrder(orientations)}")
 
             # all neighbours (including self)
-            neighbours = ServiceVicsekHelper.getNeighboursWithLimitedVision(positions=positions, orientations=orientations, domainSize=self.domainSize,
-                                                                            radius=self.radius, degreesOfVision=self.degreesOfVision)
+            neighbours = ServiceVicsekHelper.getNeighboursWithLimitedVision(positions=positions, orientations=orientations, domainSize=domainSize,
+                                                                            radius=self.radius, fov=self.degreesOfVision)
             
             orientations, nsms, ks, speeds, blocked, self.colours = self.handleEvents(t, positions, orientations, nsms, ks, speeds, activationTimeDelays)
 
 
             if self.switchSummary != None:
-                thresholdEvaluationChoiceValues = ServiceThresholdEvaluation.getThresholdEvaluationValuesForChoice(thresholdEvaluationMethod=self.thresholdEvaluationMethod, positions=positions, orientations=orientations, neighbours=neighbours, domainSize=self.domainSize)
+                thresholdEvaluationChoiceValues = ServiceThresholdEvaluation.getThresholdEvaluationValuesForChoice(thresholdEvaluationMethod=self.thresholdEvaluationMethod, positions=positions, orientations=orientations, neighbours=neighbours, domainSize=domainSize)
 
-                self.thresholdEvaluationChoiceValuesHistory.append(thresholdEvaluationChoiceValues)
+                self.thresholdEvaluationChoiceValuesHistory[t] = thresholdEvaluationChoiceValues
             
                 if SwitchType.NEIGHBOUR_SELECTION_MECHANISM in self.switchSummary.switches.keys():
                     nsms = self.getDecisions(t, neighbours, thresholdEvaluationChoiceValues, self.thresholdEvaluationChoiceValuesHistory, SwitchType.NEIGHBOUR_SELECTION_MECHANISM, nsms, blocked)
@@ -647,8 +687,7 @@ class VicsekWithNeighbourSelection():
 
             orientations = self.computeNewOrientations(neighbours, positions, orientations, nsms, ks, activationTimeDelays)
 
-            positions += self.dt*(orientations.T * speeds).T
-            positions += -self.domainSize*np.floor(positions/self.domainSize)
+            positions = self.updatePositions(positions, orientations, speeds)
 
             self.updateHistoriesAndLogs(t=t,
                                         positions=positions,
@@ -656,7 +695,8 @@ class VicsekWithNeighbourSelection():
                                         nsms=nsms,
                                         ks=ks,
                                         speeds=speeds,
-                                        activationTimeDelays=activationTimeDelays)
+                                        activationTimeDelays=activationTimeDelays,
+                                        colours=self.colours)
 
             # if t % 500 == 0:
             #     print(f"t={t}, th={self.thresholdEvaluationMethod.name}, order={ServiceMetric.computeGlobalOrder(orientations)}")
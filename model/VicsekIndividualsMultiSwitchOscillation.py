@@ -20,7 +20,7 @@ class VicsekWithNeighbourSelectionOscillation(VicsekWithNeighbourSelection):
                  speed=1, switchSummary=None, events=None, degreesOfVision=2*np.pi, 
                  activationTimeDelays=[], isActivationTimeDelayRelevantForEvents=False, colourType=None, 
                  thresholdEvaluationMethod=ThresholdEvaluationMethod.LOCAL_ORDER, updateIfNoNeighbours=True,
-                 individualistic_stress_delta=0.01, social_stress_delta=0.01, stress_num_neighbours=2):
+                 individualistic_stress_delta=0.01, social_stress_delta=0.01, stress_num_neighbours=2, seed=None, historyPath=None):
         """
         Params:
             - domainSize (tuple of floats): the size of the domain
@@ -36,6 +36,8 @@ class VicsekWithNeighbourSelectionOscillation(VicsekWithNeighbourSelection):
             - activationTimeDelays (array of int) [optional]: how often each individual updates its orientation
             - isActivationTimeDelayRelevantForEvents (boolean) [optional]: whether an individual should also ignore events when it is not ready to update its orientation
             - colourType (ColourType) [optional]: if and how individuals should be coloured for future rendering
+            - seed (int) [optional]: the seed of the random number generator used during the simulation
+            - historyPath (string) [optional]: if set, the histories are written to memory-mapped .npy files starting with this path instead of being kept in memory
         """
         super().__init__(domainSize=domainSize,
                          radius=radius,
@@ -51,7 +53,9 @@ class VicsekWithNeighbourSelectionOscillation(VicsekWithNeighbourSelection):
                          isActivationTimeDelayRelevantForEvents=isActivationTimeDelayRelevantForEvents,
                          colourType=colourType,
                          thresholdEvaluationMethod=thresholdEvaluationMethod,
-                         updateIfNoNeighbours=updateIfNoNeighbours)
+                         updateIfNoNeighbours=updateIfNoNeighbours,
+                         seed=seed,
+                         historyPath=historyPath)
 
         self.individualistic_stress_delta = individualistic_stress_delta
         self.social_stress_delta = social_stress_delta
@@ -67,6 +71,9 @@ class VicsekWithNeighbourSelectionOscillation(VicsekWithNeighbourSelection):
         Returns:
             A dictionary or a single string containing all model parameters.
         """
+        # the summary only changes when a new simulation is prepared
+        if self._parameterSummary != None:
+            return self._parameterSummaryString if asString else self._parameterSummary
         summary = {"n": self.numberOfParticles,
                     "k": self.k,
                     "noise": self.noise,
@@ -97,9 +104,10 @@ class VicsekWithNeighbourSelectionOscillation(VicsekWithNeighbourSelection):
                 eventsSummary.append(event.getParameterSummary())
             summary["events"] = eventsSummary
 
+        self._parameterSummary = summary
+        self._parameterSummaryString = ", ".join([f"{key}: {value}" for key, value in summary.items()])
         if asString:
-            strPrep = [tup[0] + ": " + tup[1] for tup in summary.values()]
-            return ", ".join(strPrep)
+            return self._parameterSummaryString
         return summary
      
     def getDecisions(self, t, neighbours, thresholdEvaluationChoiceValues, previousthresholdEvaluationChoiceValues, switchType, switchTypeValues, blocked, stressLevels):
@@ -146,11 +154,20 @@ class VicsekWithNeighbourSelectionOscillation(VicsekWithNeighbourSelection):
         """
          # Preparations and setting of parameters if they are not passed to the method
         
+        self._parameterSummary = None
         if any(ele is None for ele in initialState):
             positions, orientations = self.initializeState()
         else:
             positions, orientations = initialState
 
+        # single precision is sufficient for the model and halves the memory traffic
+        positions = np.asarray(positions, dtype=np.float32)
+        orientations = np.asarray(orientations, dtype=np.float32)
+
+        # the dimensionality and the domain in the type of the positions are needed at every timestep
+        self._dim = len(self.domainSize)
+        self._domain = np.asarray(self.domainSize, dtype=positions.dtype)
+
         nsms, ks, speeds, activationTimeDelays = self.initialiseSwitchingValues()
 
         stressLevels = np.zeros(self.numberOfParticles)
@@ -169,18 +186,24 @@ class VicsekWithNeighbourSelectionOscillation(VicsekWithNeighbourSelection):
 
         # Initialisations for the loop and the return variables
         self.numIntervals=int(tmax/dt+1)
+        self.prepareNoise()
+        self._velocityBuffer = np.empty((self.numberOfParticles, self._dim), dtype=np.float32)
 
-        self.thresholdEvaluationChoiceValuesHistory = []  
-        self.positionsHistory = np.zeros((self.numIntervals,self.numberOfParticles,len(self.domainSize)))
-        self.orientationsHistory = np.zeros((self.numIntervals,self.numberOfParticles,len(self.domainSize)))  
-        self.stressLevelsHistory = np.zeros((self.numIntervals,self.numberOfParticles))
-        self.switchTypeValuesHistory = {'nsms': [], 'ks': [], 'speeds': [], 'activationTimeDelays': []}
+        # the local orders are only needed to decide when to switch
+        if self.switchSummary != None:
+            self.thresholdEvaluationChoiceValuesHistory = np.zeros((self.numIntervals, self.numberOfParticles), dtype=np.float32)
+        else:
+            self.thresholdEvaluationChoiceValuesHistory = None
+        self.positionsHistory = self.createHistory("positions", (self.numIntervals,self.numberOfParticles,self._dim))
+        self.orientationsHistory = self.createHistory("orientations", (self.numIntervals,self.numberOfParticles,self._dim))
+        self.stressLevelsHistory = self.createHistory("stressLevels", (self.numIntervals,self.numberOfParticles), dtype=float)
+        self.prepareSwitchValuesHistory()
         self.coloursHistory = self.numIntervals * [self.numberOfParticles * ['k']]
 
         self.positionsHistory[0,:,:]=positions
         self.orientationsHistory[0,:,:]=orientations
         self.stressLevelsHistory[0,:]=stressLevels
-        self.appendSwitchValues(nsms, ks, speeds, activationTimeDelays)
+        self.storeSwitchValues(0, nsms, ks, speeds, activationTimeDelays)
 
         return positions, orientations, nsms, ks, speeds, activationTimeDelays, stressLevels
     
@@ -209,7 +232,10 @@ class VicsekWithNeighbourSelectionOscillation(VicsekWithNeighbourSelection):
        
         positions, orientations, nsms, ks, speeds, activationTimeDelays, stressLevels = self.prepareSimulation(initialState=initialState, dt=dt, tmax=tmax)
         if self.colourType == ColourType.EXAMPLE:
-            self.exampleId = np.random.choice(self.numberOfParticles, 1)
+            self.exampleId = self._rng.choice(self.numberOfParticles, 1)
+
+        # looked up once rather than at every timestep
+        domainSize = self.domainSize
         for t in range(self.numIntervals):
             self.t = t
             # if t % 5000 == 0:
@@ -218,15 +244,15 @@ class VicsekWithNeighbourSelectionOscillation(VicsekWithNeighbourSelection):
             #     print(f"{t}: {ServiceMetric.computeGlobalOrder(orientations)}")
 
             # all neighbours (including self)
-            neighbours = ServiceVicsekHelper.getNeighboursWithLimitedVision(positions=positions, orientations=orientations, domainSize=self.domainSize,
-                                                                            radius=self.radius, degreesOfVision=self.degreesOfVision)
+            neighbours = ServiceVicsekHelper.getNeighboursWithLimitedVision(positions=positions, orientations=orientations, domainSize=domainSize,
+                                                                            radius=self.radius, fov=self.degreesOfVision)
             stressLevels = self.updateStressLevels(stressLevels, neighbours)
             orientations, nsms, ks, speeds, blocked, self.colours = self.handleEvents(t, positions, orientations, nsms, ks, speeds, activationTimeDelays)
 
             if self.switchSummary != None:
-                thresholdEvaluationChoiceValues = ServiceThresholdEvaluation.getThresholdEvaluationValuesForChoice(thresholdEvaluationMethod=self.thresholdEvaluationMethod, positions=positions, orientations=orientations, neighbours=neighbours, domainSize=self.domainSize)
+                thresholdEvaluationChoiceValues = ServiceThresholdEvaluation.getThresholdEvaluationValuesForChoice(thresholdEvaluationMethod=self.thresholdEvaluationMethod, positions=positions, orientations=orientations, neighbours=neighbours, domainSize=domainSize)
 
-                self.thresholdEvaluationChoiceValuesHistory.append(thresholdEvaluationChoiceValues)
+                self.thresholdEvaluationChoiceValuesHistory[t] = thresholdEvaluationChoiceValues
             
                 if SwitchType.NEIGHBOUR_SELECTION_MECHANISM in self.switchSummary.switches.keys():
                     nsms = self.getDecisions(t, neighbours, thresholdEvaluationChoiceValues, self.thresholdEvaluationChoiceValuesHistory, SwitchType.NEIGHBOUR_SELECTION_MECHANISM, nsms, blocked, stressLevels)
@@ -239,14 +265,13 @@ class VicsekWithNeighbourSelectionOscillation(VicsekWithNeighbourSelection):
 
             orientations = self.computeNewOrientations(neighbours, positions, orientations, nsms, ks, activationTimeDelays)
 
-            positions += self.dt*(orientations.T * speeds).T
-            positions += -self.domainSize*np.floor(positions/self.domainSize)
+            positions = self.updatePositions(positions, orientations, speeds)
 
             self.positionsHistory[t,:,:]=positions
             self.orientationsHistory[t,:,:]=orientations
             self.stressLevelsHistory[t,:]=stressLevels
 
-            self.appendSwitchValues(nsms, ks, speeds, activationTimeDelays)
+            self.storeSwitchValues(t+1, nsms, ks, speeds, activationTimeDelays)
             if self.colourType != None:
                 self.coloursHistory[t] = self.colours
 
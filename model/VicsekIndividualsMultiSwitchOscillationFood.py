@@ -1,6 +1,6 @@
 import pandas as pd
 import numpy as np
-import random
+from numba import njit
 
 from enums.EnumNeighbourSelectionMechanism import NeighbourSelectionMechanism
 from enums.EnumSwitchType import SwitchType
@@ -24,7 +24,7 @@ class VicsekWithNeighbourSelectionOscillationFood(VicsekWithNeighbourSelectionOs
                  maxFood=50, foodAppearanceProbability=0.1, foodEvents=[], foodSourceAmount=10,
                  activationTimeDelays=[], isActivationTimeDelayRelevantForEvents=False, colourType=None, 
                  thresholdEvaluationMethod=ThresholdEvaluationMethod.LOCAL_ORDER, updateIfNoNeighbours=True,
-                 individualistic_stress_delta=0.01, social_stress_delta=0.01, stress_num_neighbours=2):
+                 individualistic_stress_delta=0.01, social_stress_delta=0.01, stress_num_neighbours=2, seed=None, historyPath=None):
         """
         Params:
             - domainSize (tuple of floats): the size of the domain
@@ -40,6 +40,8 @@ class VicsekWithNeighbourSelectionOscillationFood(VicsekWithNeighbourSelectionOs
             - activationTimeDelays (array of int) [optional]: how often each individual updates its orientation
             - isActivationTimeDelayRelevantForEvents (boolean) [optional]: whether an individual should also ignore events when it is not ready to update its orientation
             - colourType (ColourType) [optional]: if and how individuals should be coloured for future rendering
+            - seed (int) [optional]: the seed of the random number generator used during the simulation
+            - historyPath (string) [optional]: if set, the histories are written to memory-mapped .npy files starting with this path instead of being kept in memory
         """
         super().__init__(domainSize=domainSize,
                          radius=radius,
@@ -58,7 +60,9 @@ class VicsekWithNeighbourSelectionOscillationFood(VicsekWithNeighbourSelectionOs
                          isActivationTimeDelayRelevantForEvents=isActivationTimeDelayRelevantForEvents,
                          colourType=colourType,
                          thresholdEvaluationMethod=thresholdEvaluationMethod,
-                         updateIfNoNeighbours=updateIfNoNeighbours)
+                         updateIfNoNeighbours=updateIfNoNeighbours,
+                         seed=seed,
+                         historyPath=historyPath)
 
         self.maxFood = maxFood
         self.foodAppearanceProbability = foodAppearanceProbability
@@ -75,6 +79,9 @@ class VicsekWithNeighbourSelectionOscillationFood(VicsekWithNeighbourSelectionOs
         Returns:
             A dictionary or a single string containing all model parameters.
         """
+        # the summary only changes when a new simulation is prepared
+        if self._parameterSummary != None:
+            return self._parameterSummaryString if asString else self._parameterSummary
         summary = {"n": self.numberOfParticles,
                     "k": self.k,
                     "noise": self.noise,
@@ -105,9 +112,10 @@ class VicsekWithNeighbourSelectionOscillationFood(VicsekWithNeighbourSelectionOs
                 eventsSummary.append(event.getParameterSummary())
             summary["events"] = eventsSummary
 
+        self._parameterSummary = summary
+        self._parameterSummaryString = ", ".join([f"{key}: {value}" for key, value in summary.items()])
         if asString:
-            strPrep = [tup[0] + ": " + tup[1] for tup in summary.values()]
-            return ", ".join(strPrep)
+            return self._parameterSummaryString
         return summary
 
     def handleFoodEvents(self, t, positions, speeds, hungerLevels):
@@ -127,31 +135,71 @@ class VicsekWithNeighbourSelectionOscillationFood(VicsekWithNeighbourSelectionOs
             Arrays containing the updates orientations, neighbour selecton mechanisms, ks, speeds, which particles are blocked from updating and the colours assigned to each particle.
         """
 
-        overallAffected = []
-        if self.foodEvents != None:
-                for event in self.foodEvents:
-                    speeds, hungerLevels, affected = event.check(self.numberOfParticles, t, positions, speeds, hungerLevels)
-                    overallAffected.append(affected)
-        # make sure that all affected particles have stopped and everyone else is moving
-        speeds = np.full(self.numberOfParticles, self.speed)
-        if len(self.foodEvents) > 0:
-            flat = np.array(list(set(np.array(np.array(overallAffected).nonzero()[1]).flatten())))
-            if len(flat) > 0:
-                speeds[flat] = 0
-        speeds = np.where(hungerLevels >= self.maxFood, self.speed, speeds)
+        self._affectedMask.fill(False)
+        if self._activeFoodEvents:
+            # the distances to all food sources are computed at once so that only the sources that someone can 
+            # reach need to be evaluated individually
+            rij2 = ServiceVicsekHelper.getSquaredDistancesFromPoints(positions, self._foodPositions, self._domain[0], self._domain[1])
+            inReach = np.any(rij2 <= self._foodRadii[:, np.newaxis]**2, axis=1)
+            for e, event in enumerate(self._activeFoodEvents):
+                if event.startTimestep <= t and event.amount > 0:
+                    if inReach[e]:
+                        speeds, hungerLevels, affected = event.feed(rij2[e], speeds, hungerLevels)
+                        self._affectedMask |= affected
+                elif event.startTimestep <= t:
+                    # the food has run out. Events that have not started yet are not ended
+                    event.end(t)
+            self.pruneFoodEvents()
+        # make sure that all affected particles that are still hungry have stopped and everyone else is moving
+        speeds = self._speedsBuffer
+        speeds.fill(self.speed)
+        speeds[self._affectedMask & (hungerLevels < self.maxFood)] = 0.0
         return speeds, hungerLevels
     
     def updateFoodEvents(self):
         if self.foodAppearanceProbability not in [None, 0]:
-            rand = random.random()
+            rand = self._rng.random()
             if rand < self.foodAppearanceProbability:
                 foodEvent = FoodEvent(startTimestep=self.t,
                                       amount=self.foodSourceAmount,
                                       domainSize=self.domainSize,
-                                      areas=[(random.random() * self.domainSize[0], random.random() * self.domainSize[1], self.radius)],
+                                      areas=[(self._rng.random() * self.domainSize[0], self._rng.random() * self.domainSize[1], self.radius)],
                                       radius=self.radius,
                                       stopMovement=True)
                 self.foodEvents.append(foodEvent)
+                self.activateFoodEvent(foodEvent)
+
+    def activateFoodEvent(self, foodEvent):
+        """
+        Adds a food event to the food sources that are checked at every timestep.
+
+        Params:
+            - foodEvent (FoodEvent): the new food source
+
+        Returns:
+            Nothing.
+        """
+        self._activeFoodEvents.append(foodEvent)
+        self._foodPositions = np.append(self._foodPositions, [foodEvent.getOriginPoint()], axis=0).astype(np.float32)
+        self._foodRadii = np.append(self._foodRadii, np.float32(foodEvent.radius)).astype(np.float32)
+
+    def pruneFoodEvents(self):
+        """
+        Removes the food sources that have run out of food and whose duration has been recorded from the food 
+        sources that are checked at every timestep. They remain part of foodEvents.
+
+        Params:
+            None
+
+        Returns:
+            Nothing.
+        """
+        keep = [event.amount > 0 or event.duration == -1 for event in self._activeFoodEvents]
+        if all(keep):
+            return
+        self._activeFoodEvents = [event for event, isKept in zip(self._activeFoodEvents, keep) if isKept]
+        self._foodPositions = self._foodPositions[keep]
+        self._foodRadii = self._foodRadii[keep]
 
 
     def simulate(self, initialState=(None, None, None), dt=None, tmax=None):
@@ -170,10 +218,17 @@ class VicsekWithNeighbourSelectionOscillationFood(VicsekWithNeighbourSelectionOs
         """
        
         positions, orientations, nsms, ks, speeds, activationTimeDelays, stressLevels = self.prepareSimulation(initialState=initialState, dt=dt, tmax=tmax)
-        hungerLevels = np.full(self.numberOfParticles, self.maxFood)
+        hungerLevels = np.full(self.numberOfParticles, self.maxFood, dtype=float)
         alive = np.full(self.numberOfParticles, True)
-        self.hungerLevelHistory = np.zeros((self.numIntervals,self.numberOfParticles))
-        self.alivenessHistory = np.zeros((self.numIntervals,self.numberOfParticles))
+        self._affectedMask = np.zeros(self.numberOfParticles, dtype=bool)
+        self._speedsBuffer = np.empty(self.numberOfParticles, dtype=np.float32)
+        self._activeFoodEvents = []
+        self._foodPositions = np.empty((0, 2), dtype=np.float32)
+        self._foodRadii = np.empty(0, dtype=np.float32)
+        for foodEvent in self.foodEvents:
+            self.activateFoodEvent(foodEvent)
+        self.hungerLevelHistory = self.createHistory("hungerLevels", (self.numIntervals,self.numberOfParticles), dtype=float)
+        self.alivenessHistory = self.createHistory("aliveness", (self.numIntervals,self.numberOfParticles), dtype=float)
 
         self.hungerLevelHistory[0] = hungerLevels
         self.alivenessHistory[0] = alive
@@ -181,11 +236,14 @@ class VicsekWithNeighbourSelectionOscillationFood(VicsekWithNeighbourSelectionOs
         everyoneDead = False
 
         if self.colourType == ColourType.EXAMPLE:
-            self.exampleId = np.random.choice(self.numberOfParticles, 1)
+            self.exampleId = self._rng.choice(self.numberOfParticles, 1)
+
+        # looked up once rather than at every timestep
+        domainSize = self.domainSize
+        N = self.numberOfParticles
+        Lx, Ly = float(domainSize[0]), float(domainSize[1])
         for t in range(self.numIntervals):
             self.t = t
-            previousHungerLevels = hungerLevels
-            
 
             self.updateFoodEvents()
             # if t % 5000 == 0:
@@ -193,10 +251,17 @@ class VicsekWithNeighbourSelectionOscillationFood(VicsekWithNeighbourSelectionOs
             # if self.t % 100 == 0:
             #     print(f"{t}: {ServiceMetric.computeGlobalOrder(orientations)}")
 
-            # all neighbours (including self)
-            neighbours = ServiceVicsekHelper.getNeighboursWithLimitedVision(positions=positions, orientations=orientations, domainSize=self.domainSize,
-                                                                            radius=self.radius, degreesOfVision=self.degreesOfVision)
-            neighbours = neighbours * np.array([alive]*self.numberOfParticles)
+            # all living neighbours (including self). The search among the living individuals leaves out the dead, 
+            # whose living neighbours are determined row by row
+            aliveIndices = np.flatnonzero(alive)
+            deadIndices = np.flatnonzero(~alive)
+            neighbours = np.zeros((N, N), dtype=bool)
+            neighbours[np.ix_(aliveIndices, aliveIndices)] = ServiceVicsekHelper.getNeighboursWithLimitedVision(positions=positions[aliveIndices], orientations=orientations[aliveIndices], 
+                                                                                                              domainSize=domainSize, radius=self.radius, fov=self.degreesOfVision)
+            if len(deadIndices) > 0:
+                neighbours[deadIndices] = ServiceVicsekHelper.getNeighbourRowsWithLimitedVision(positions=positions, orientations=orientations, indices=deadIndices, 
+                                                                                              domainSize=domainSize, radius=self.radius, fov=self.degreesOfVision)
+                neighbours[deadIndices] &= alive
             stressLevels = self.updateStressLevels(stressLevels, neighbours)
             orientations, nsms, ks, speeds, blocked, self.colours = self.handleEvents(t, positions, orientations, nsms, ks, speeds, activationTimeDelays)
             self.colours = np.where(alive, 'k', 'w')
@@ -204,9 +269,9 @@ class VicsekWithNeighbourSelectionOscillationFood(VicsekWithNeighbourSelectionOs
             speeds, hungerLevels = self.handleFoodEvents(t, positions, speeds, hungerLevels)
 
             if self.switchSummary != None:
-                thresholdEvaluationChoiceValues = ServiceThresholdEvaluation.getThresholdEvaluationValuesForChoice(thresholdEvaluationMethod=self.thresholdEvaluationMethod, positions=positions, orientations=orientations, neighbours=neighbours, domainSize=self.domainSize)
+                thresholdEvaluationChoiceValues = ServiceThresholdEvaluation.getThresholdEvaluationValuesForChoice(thresholdEvaluationMethod=self.thresholdEvaluationMethod, positions=positions, orientations=orientations, neighbours=neighbours, domainSize=domainSize)
 
-                self.thresholdEvaluationChoiceValuesHistory.append(thresholdEvaluationChoiceValues)
+                self.thresholdEvaluationChoiceValuesHistory[t] = thresholdEvaluationChoiceValues
             
                 if SwitchType.NEIGHBOUR_SELECTION_MECHANISM in self.switchSummary.switches.keys():
                     nsms = self.getDecisions(t, neighbours, thresholdEvaluationChoiceValues, self.thresholdEvaluationChoiceValuesHistory, SwitchType.NEIGHBOUR_SELECTION_MECHANISM, nsms, blocked, stressLevels)
@@ -219,14 +284,8 @@ class VicsekWithNeighbourSelectionOscillationFood(VicsekWithNeighbourSelectionOs
 
             orientations = self.computeNewOrientations(neighbours, positions, orientations, nsms, ks, activationTimeDelays)
 
-            positions += self.dt*(orientations.T * speeds).T
-            positions += -self.domainSize*np.floor(positions/self.domainSize)
-
             # if an individual is not feeding, it gets more hungry at every timestep
-            reducedHungerLevels = hungerLevels - 0.1
-            hungerLevels = np.where(hungerLevels == previousHungerLevels, reducedHungerLevels, hungerLevels)
-
-            alive = np.where(hungerLevels > 0, True, False)
+            alive = _advanceIndividuals(positions, orientations, speeds, hungerLevels, self._affectedMask, alive, self.dt, Lx, Ly)
 
             self.positionsHistory[t,:,:]=positions
             self.orientationsHistory[t,:,:]=orientations
@@ -234,7 +293,7 @@ class VicsekWithNeighbourSelectionOscillationFood(VicsekWithNeighbourSelectionOs
             self.hungerLevelHistory[t,:]=hungerLevels
             self.alivenessHistory[t,:]=alive
 
-            self.appendSwitchValues(nsms, ks, speeds, activationTimeDelays)
+            self.storeSwitchValues(t+1, nsms, ks, speeds, activationTimeDelays)
             self.coloursHistory[t] = self.colours
 
             if np.count_nonzero(alive) == 0 and everyoneDead == False:
@@ -246,3 +305,38 @@ class VicsekWithNeighbourSelectionOscillationFood(VicsekWithNeighbourSelectionOs
             
         print(f"num foodev: {len(self.foodEvents)}")
         return (self.dt*np.arange(self.numIntervals), self.positionsHistory, self.orientationsHistory), self.switchTypeValuesHistory, self.coloursHistory, self.stressLevelsHistory, self.hungerLevelHistory, self.alivenessHistory, self.foodEvents
+
+
+@njit(cache=True)
+def _advanceIndividuals(positions, orientations, speeds, hungerLevels, feeding, alive, dt, Lx, Ly):
+    """
+    Advances every individual by one timestep in a single pass: moves it along its orientation, wraps it 
+    around the periodic domain and makes it hungrier if it has not been feeding. Dead individuals do not move. 
+    Positions and hunger levels are updated in place.
+
+    Params:
+        - positions (array of floats): the position of every individual at the current timestep
+        - orientations (array of floats): the orientation of every individual after the current timestep
+        - speeds (array of floats): the speed of every individual
+        - hungerLevels (array of floats): the hunger level of every individual after feeding at the current timestep
+        - feeding (array of booleans): whether every individual has been feeding at the current timestep
+        - alive (array of booleans): whether every individual was alive at the start of the current timestep
+        - dt (float): the difference between the timesteps
+        - Lx (float): the size of the domain along the x-axis
+        - Ly (float): the size of the domain along the y-axis
+
+    Returns:
+        An array of booleans representing which individuals are still alive.
+    """
+    n = positions.shape[0]
+    stillAlive = np.empty(n, dtype=np.bool_)
+    for i in range(n):
+        if alive[i]:
+            x = positions[i, 0] + dt * orientations[i, 0] * speeds[i]
+            y = positions[i, 1] + dt * orientations[i, 1] * speeds[i]
+            positions[i, 0] = ServiceVicsekHelper.wrapCoordinate(x, Lx)
+            positions[i, 1] = ServiceVicsekHelper.wrapCoordinate(y, Ly)
+        if not feeding[i]:
+            hungerLevels[i] -= 0.1
+        stillAlive[i] = hungerLevels[i] > 0
+    return stillAlive
@@ -1,6 +1,6 @@
 #import csv
 
-import codecs, json, csv
+import codecs, json, csv, pickle
 import numpy as np
 import pandas as pd
 """
@@ -45,6 +45,49 @@ def saveModel(simulationData, path="sample.json", modelParams=None, saveInterval
     saveDict(path, dict, modelParams)
 
 
+def saveModelCompressed(simulationData, path="sample.npz", modelParams=None, saveInterval=1, **extras):
+    """
+    Saves a model trained by the Viscek simulator implementation as a compressed numpy archive. Much faster and 
+    smaller than saving as JSON as the arrays are stored in binary form. Positions and orientations are stored as float32.
+    The model params and any extras are pickled to a separate file next to the archive.
+
+    Parameters:
+        - simulationData (times, positions, orientations): the data to be saved
+        - path (string) [optional]: the location and name of the target file
+        - modelParams (dict) [optional]: a summary of the model's params such as n, k, neighbourSelectionMode etc.
+        - saveInterval (int) [optional]: specifies the interval at which the saving should occur, i.e. if any time steps should be skipped
+        - extras (keyword arguments) [optional]: any further data to be saved, e.g. switchValues, colours, hungerLevels or foodEvents
+
+    Returns:
+        Nothing. Creates or overwrites two files: the archive and the pickled metadata.
+    """
+    time, positions, orientations = simulationData
+    np.savez_compressed(path, 
+                        time=np.asarray(time)[::saveInterval], 
+                        positions=np.asarray(positions, dtype=np.float32)[::saveInterval], 
+                        orientations=np.asarray(orientations, dtype=np.float32)[::saveInterval])
+    with open(f"{path}.meta.pkl", "wb") as f:
+        pickle.dump((modelParams, extras), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def loadModelCompressed(path, loadExtras=False):
+    """
+    Loads a single model saved by saveModelCompressed.
+
+    Parameters:
+        - path (string): the location and file name of the archive containing the model data
+        - loadExtras (boolean) [optional]: also returns the extras that were saved alongside the model
+
+    Returns:
+        The model's params as well as the simulation data containing the time, positions, orientations and optionally the extras as a dictionary.
+    """
+    with np.load(path) as data:
+        simulationData = (data["time"], data["positions"], data["orientations"])
+    with open(f"{path}.meta.pkl", "rb") as f:
+        modelParams, extras = pickle.load(f)
+    if loadExtras:
+        return modelParams, simulationData, extras
+    return modelParams, simulationData
+
 def logModelParams(path, modelParamsDict):
     """
     Logs the model params as a single row with headers.
@@ -33,7 +33,7 @@ def computeLocalOrders(orientations, neighbours):
     Returns:
         An array of floats representing the local order for every individual at the current time step (values between 0 and 1)
     """
-    sumOrientation = np.sum(neighbours[:,:,np.newaxis]*orientations[np.newaxis,:,:],axis=1)
+    sumOrientation = neighbours.astype(orientations.dtype) @ orientations
     return np.divide(np.sqrt(np.sum(sumOrientation**2,axis=1)), np.count_nonzero(neighbours, axis=1))
 
 def computeNormalisedOrientationDifferences(orientations, neighbours, domainSize):
@@ -0,0 +1,136 @@
+import numpy as np
+
+try:
+    import cupy as cp
+except ImportError:
+    cp = None
+
+"""
+Service that runs the timestep of the 2D Vicsek model without occlusion on a CUDA device. Requires CuPy.
+"""
+
+# number of threads per block of the orientation kernel
+THREADS_PER_BLOCK = 128
+
+_ORIENTATIONS_SOURCE = r'''
+extern "C" __global__
+void computeOrientations(const float* positions, const float* orientations, const float* noise,
+                         const int* cellStarts, const int* sortedIndices, const int n, const int nx, const int ny,
+                         const float radiusSquared, const float cosHalfFov, const float Lx, const float Ly,
+                         float* newOrientations)
+{
+    int i = blockDim.x * blockIdx.x + threadIdx.x;
+    if (i >= n) {
+        return;
+    }
+    float px = positions[2*i];
+    float py = positions[2*i + 1];
+    float ox = orientations[2*i];
+    float oy = orientations[2*i + 1];
+    int cx = min(max((int)(px / Lx * nx), 0), nx - 1);
+    int cy = min(max((int)(py / Ly * ny), 0), ny - 1);
+    int numberOfCellsX = nx < 3 ? nx : 3;
+    int numberOfCellsY = ny < 3 ? ny : 3;
+    float sx = 0.0f;
+    float sy = 0.0f;
+    for (int a = 0; a < numberOfCellsX; a++) {
+        int neighbourCx = nx < 3 ? a : (cx + a - 1 + nx) % nx;
+        for (int b = 0; b < numberOfCellsY; b++) {
+            int neighbourCy = ny < 3 ? b : (cy + b - 1 + ny) % ny;
+            int cell = neighbourCx*ny + neighbourCy;
+            for (int index = cellStarts[cell]; index < cellStarts[cell + 1]; index++) {
+                int j = sortedIndices[index];
+                if (j != i) {
+                    // the field of vision is determined without the periodic boundaries
+                    float dx = positions[2*j] - px;
+                    float dy = positions[2*j + 1] - py;
+                    float distanceSquared = dx*dx + dy*dy;
+                    if (distanceSquared == 0.0f || distanceSquared > radiusSquared) {
+                        continue;
+                    }
+                    // a full field of vision sees everything, even if the orientation is not exactly of unit length
+                    if (cosHalfFov > -1.0f && dx*ox + dy*oy < cosHalfFov * sqrtf(distanceSquared)) {
+                        continue;
+                    }
+                }
+                sx += orientations[2*j];
+                sy += orientations[2*j + 1];
+            }
+        }
+    }
+    float norm = sqrtf(sx*sx + sy*sy);
+    float ux = sx / norm + noise[2*i];
+    float uy = sy / norm + noise[2*i + 1];
+    norm = sqrtf(ux*ux + uy*uy);
+    newOrientations[2*i] = ux / norm;
+    newOrientations[2*i + 1] = uy / norm;
+}
+'''
+
+_orientationsKernel = cp.RawKernel(_ORIENTATIONS_SOURCE, "computeOrientations") if cp is not None else None
+
+def isAvailable():
+    """
+    Checks whether CuPy could be imported.
+
+    Params:
+        None
+
+    Returns:
+        A boolean representing whether the GPU backend can be used.
+    """
+    return cp is not None
+
+def getCellList(positions, cellSize, Lx, Ly):
+    """
+    Sorts the positions into a uniform grid of cells on the device. Equivalent to ServiceVicsekHelper.getCellList().
+
+    Params:
+        - positions (cupy array of floats): the (x,y)-coordinates of every point within the domain
+        - cellSize (float): the minimal width of a cell
+        - Lx (float): the size of the domain along the x-axis
+        - Ly (float): the size of the domain along the y-axis
+
+    Returns:
+        The number of cells along the x- and y-axis, the index at which the points of every cell (cx*ny + cy) start
+        and the indices of the points ordered by cell.
+    """
+    nx = max(1, int(Lx // cellSize))
+    ny = max(1, int(Ly // cellSize))
+    cx = cp.clip((positions[:, 0] / Lx * nx).astype(cp.int32), 0, nx - 1)
+    cy = cp.clip((positions[:, 1] / Ly * ny).astype(cp.int32), 0, ny - 1)
+    cells = cx*ny + cy
+    sortedIndices = cp.argsort(cells).astype(cp.int32)
+    cellStarts = cp.searchsorted(cells[sortedIndices], cp.arange(nx*ny + 1, dtype=cp.int32)).astype(cp.int32)
+    return nx, ny, cellStarts, sortedIndices
+
+def step(positions, orientations, speeds, noise, radius, cosHalfFov, dt, Lx, Ly, newOrientations):
+    """
+    Computes a single timestep of a 2D simulation without occlusion on the device with one thread per individual.
+    Follows the compiled CPU step in model.Vicsek.
+
+    Params:
+        - positions (cupy array of floats): the position of every individual. Updated in place
+        - orientations (cupy array of floats): the orientation of every individual at the current timestep
+        - speeds (cupy array of floats): the speed of every individual
+        - noise (cupy array of floats): the noise added to the orientation of every individual
+        - radius (float): the perception radius of the individuals
+        - cosHalfFov (float): the cosine of half the field of vision
+        - dt (float): the difference between the timesteps
+        - Lx (float): the size of the domain along the x-axis
+        - Ly (float): the size of the domain along the y-axis
+        - newOrientations (cupy array of floats): the array that the orientations after the timestep are written into
+
+    Returns:
+        Nothing. The results are written into positions and newOrientations.
+    """
+    n = positions.shape[0]
+    nx, ny, cellStarts, sortedIndices = getCellList(positions, radius, Lx, Ly)
+    numberOfBlocks = (n + THREADS_PER_BLOCK - 1) // THREADS_PER_BLOCK
+    _orientationsKernel((numberOfBlocks,), (THREADS_PER_BLOCK,),
+                        (positions, orientations, noise, cellStarts, sortedIndices, np.int32(n), np.int32(nx), np.int32(ny),
+                         np.float32(radius * radius), np.float32(cosHalfFov), np.float32(Lx), np.float32(Ly), newOrientations))
+    positions += np.float32(dt) * newOrientations * speeds[:, cp.newaxis]
+    domain = cp.asarray([Lx, Ly], dtype=cp.float32)
+    positions -= domain * (positions >= domain)
+    positions += domain * (positions < 0)
@@ -1,8 +1,14 @@
 import numpy as np
 import random
+from numba import njit, prange
+from scipy.spatial import cKDTree
 
+import services.ServiceOrientations as ServiceOrientations
 import services.ServiceVision as ServiceVision
 
+# number of individuals per block in the pairwise kernels so that both blocks stay in the L1 cache
+TILE_SIZE = 64
+
 def getDifferences(array, domainSize):
     """
     Computes the differences between all individuals for the values provided by the array.
@@ -13,9 +19,167 @@ def getDifferences(array, domainSize):
     Returns:
         An array of arrays of floats containing the difference between each pair of values.
     """
-    rij=array[:,np.newaxis,:]-array   
-    rij = rij - domainSize*np.rint(rij/domainSize) #minimum image convention
-    return np.sum(rij**2,axis=2)
+    if array.shape[1] != 2:
+        rij=array[:,np.newaxis,:]-array   
+        rij = rij - domainSize*np.rint(rij/domainSize) #minimum image convention
+        return np.sum(rij**2,axis=2)
+    out = np.empty((len(array), len(array)))
+    getSquaredDistances(np.ascontiguousarray(array, dtype=np.float64), float(domainSize[0]), float(domainSize[1]), out)
+    return out
+
+@njit(parallel=True, fastmath=True, cache=True)
+def getSquaredDistances(positions, Lx, Ly, out):
+    """
+    Computes the squared distance between all pairs of points in a 2D periodic domain. The pairs are processed 
+    in blocks of TILE_SIZE x TILE_SIZE and the blocks of rows are distributed across threads.
+
+    Params:
+        - positions (array of floats): the (x,y)-coordinates of every point
+        - Lx (float): the size of the domain along the x-axis
+        - Ly (float): the size of the domain along the y-axis
+        - out (array of arrays of floats): the (n,n) array that the squared distances are written into
+
+    Returns:
+        Nothing. The results are written into out.
+    """
+    n = positions.shape[0]
+    numberOfTiles = (n + TILE_SIZE - 1) // TILE_SIZE
+    for tileI in prange(numberOfTiles):
+        iStart = tileI * TILE_SIZE
+        iEnd = min(iStart + TILE_SIZE, n)
+        for jStart in range(0, n, TILE_SIZE):
+            jEnd = min(jStart + TILE_SIZE, n)
+            for i in range(iStart, iEnd):
+                for j in range(jStart, jEnd):
+                    dx = positions[i, 0] - positions[j, 0]
+                    dx -= Lx * np.rint(dx / Lx) # minimum image convention
+                    dy = positions[i, 1] - positions[j, 1]
+                    dy -= Ly * np.rint(dy / Ly)
+                    out[i, j] = dx*dx + dy*dy
+
+@njit(fastmath=True, cache=True)
+def getSquaredDistancesFromPoint(posX, posY, ox, oy, Lx, Ly):
+    """
+    Computes the squared distance of every point to a single point in a 2D periodic domain.
+
+    Params:
+        - posX (array of floats): the x-coordinate of every point
+        - posY (array of floats): the y-coordinate of every point
+        - ox (float): the x-coordinate of the reference point
+        - oy (float): the y-coordinate of the reference point
+        - Lx (float): the size of the domain along the x-axis
+        - Ly (float): the size of the domain along the y-axis
+
+    Returns:
+        An array of floats containing the squared distance of every point to the reference point.
+    """
+    n = posX.shape[0]
+    rij2 = np.empty(n, dtype=posX.dtype)
+    for i in range(n):
+        dx = posX[i] - ox
+        dx -= Lx * np.rint(dx / Lx) # minimum image convention
+        dy = posY[i] - oy
+        dy -= Ly * np.rint(dy / Ly)
+        rij2[i] = dx*dx + dy*dy
+    return rij2
+
+@njit(fastmath=True, cache=True)
+def getSquaredDistancesFromPoints(positions, points, Lx, Ly):
+    """
+    Computes the squared distance of every position to each of several points in a 2D periodic domain.
+
+    Params:
+        - positions (array of floats): the (x,y)-coordinates of every position
+        - points (array of floats): the (x,y)-coordinates of every reference point
+        - Lx (float): the size of the domain along the x-axis
+        - Ly (float): the size of the domain along the y-axis
+
+    Returns:
+        An array of floats of shape (number of points, number of positions) containing the squared distances.
+    """
+    n = positions.shape[0]
+    rij2 = np.empty((points.shape[0], n), dtype=positions.dtype)
+    for e in range(points.shape[0]):
+        ox = points[e, 0]
+        oy = points[e, 1]
+        for i in range(n):
+            dx = positions[i, 0] - ox
+            dx -= Lx * np.rint(dx / Lx) # minimum image convention
+            dy = positions[i, 1] - oy
+            dy -= Ly * np.rint(dy / Ly)
+            rij2[e, i] = dx*dx + dy*dy
+    return rij2
+
+@njit(cache=True)
+def wrapCoordinate(x, L):
+    """
+    Wraps a coordinate back into the periodic domain. As an individual moves less than the size of the domain 
+    in a single timestep, a single subtraction or addition suffices and no floor is needed.
+
+    Params:
+        - x (float): the coordinate after the movement
+        - L (float): the size of the domain along the axis of the coordinate
+
+    Returns:
+        The coordinate within [0, L).
+    """
+    if x >= L:
+        return x - L
+    if x < 0:
+        return x + L
+    return x
+
+@njit(cache=True)
+def getCellList(positions, cellSize, Lx, Ly):
+    """
+    Sorts the positions into a uniform grid of cells that are at least cellSize wide so that all points within 
+    a distance of cellSize of a point lie in its own or one of the eight surrounding cells.
+
+    Params:
+        - positions (array of floats): the (x,y)-coordinates of every point within the domain
+        - cellSize (float): the minimal width of a cell
+        - Lx (float): the size of the domain along the x-axis
+        - Ly (float): the size of the domain along the y-axis
+
+    Returns:
+        The number of cells along the x- and y-axis, the index at which the points of every cell (cx*ny + cy) start 
+        and the indices of the points ordered by cell.
+    """
+    n = positions.shape[0]
+    nx = max(1, int(Lx // cellSize))
+    ny = max(1, int(Ly // cellSize))
+    cells = np.empty(n, dtype=np.int64)
+    cellStarts = np.zeros(nx*ny + 1, dtype=np.int64)
+    for i in range(n):
+        cx = min(max(int(positions[i, 0] / Lx * nx), 0), nx - 1)
+        cy = min(max(int(positions[i, 1] / Ly * ny), 0), ny - 1)
+        cells[i] = cx*ny + cy
+        cellStarts[cells[i] + 1] += 1
+    for cell in range(nx*ny):
+        cellStarts[cell + 1] += cellStarts[cell]
+    fill = cellStarts[:-1].copy()
+    sortedIndices = np.empty(n, dtype=np.int64)
+    for i in range(n):
+        sortedIndices[fill[cells[i]]] = i
+        fill[cells[i]] += 1
+    return nx, ny, cellStarts, sortedIndices
+
+@njit(cache=True)
+def getSurroundingCells(c, numberOfCells):
+    """
+    Determines the cells along one axis that need to be searched for the neighbours of a point in cell c, 
+    wrapping around the periodic boundaries. Every cell is only returned once, even if there are fewer than three.
+
+    Params:
+        - c (int): the cell of the point along the axis
+        - numberOfCells (int): the number of cells along the axis
+
+    Returns:
+        An array containing the cells to be searched.
+    """
+    if numberOfCells < 3:
+        return np.arange(numberOfCells)
+    return np.array([(c - 1) % numberOfCells, c, (c + 1) % numberOfCells])
 
 def getOrientationDifferences(orientations, domainSize):
     """
@@ -29,6 +193,91 @@ def getPositionDifferences(positions, domainSize):
     """
     return getDifferences(positions, domainSize)
 
+def getPeriodicTree(positions, domainSize):
+    """
+    Builds a k-d tree over the positions that respects the periodic boundaries of the domain.
+
+    Params:
+        - positions (array of floats): the position of every individual at the current timestep
+        - domainSize (tuple of floats): the size of the domain
+
+    Returns:
+        A cKDTree containing the positions of all individuals.
+    """
+    domainSize = np.asarray(domainSize, dtype=float)
+    wrapped = np.mod(positions, domainSize)
+    wrapped = np.where(wrapped >= domainSize, 0, wrapped) # np.mod can round up to the domain size itself
+    return cKDTree(wrapped, boxsize=domainSize)
+
+@njit(parallel=True, cache=True)
+def getPeriodicNeighbourPairs(positions, radius, Lx, Ly):
+    """
+    Determines all pairs of points within the radius of each other in a 2D periodic domain using a cell list. 
+    The number of pairs of every point is counted first so that the pairs can be written in parallel.
+
+    Params:
+        - positions (array of floats): the (x,y)-coordinates of every point within the domain
+        - radius (float): the maximal distance between the points of a pair
+        - Lx (float): the size of the domain along the x-axis
+        - Ly (float): the size of the domain along the y-axis
+
+    Returns:
+        An array of shape (numberOfPairs, 2) containing every pair (i,j) with i < j once.
+    """
+    n = positions.shape[0]
+    radiusSquared = radius * radius
+    nx, ny, cellStarts, sortedIndices = getCellList(positions, radius, Lx, Ly)
+    counts = np.zeros(n + 1, dtype=np.int64)
+    for write in range(2):
+        if write == 1:
+            for i in range(n):
+                counts[i + 1] += counts[i]
+            pairs = np.empty((counts[n], 2), dtype=np.int64)
+        else:
+            pairs = np.empty((0, 2), dtype=np.int64)
+        for i in prange(n):
+            cx = min(max(int(positions[i, 0] / Lx * nx), 0), nx - 1)
+            cy = min(max(int(positions[i, 1] / Ly * ny), 0), ny - 1)
+            found = 0
+            for neighbourCx in getSurroundingCells(cx, nx):
+                for neighbourCy in getSurroundingCells(cy, ny):
+                    cell = neighbourCx*ny + neighbourCy
+                    for index in range(cellStarts[cell], cellStarts[cell + 1]):
+                        j = sortedIndices[index]
+                        if j <= i:
+                            continue
+                        dx = positions[i, 0] - positions[j, 0]
+                        dx -= Lx * np.rint(dx / Lx) # minimum image convention
+                        dy = positions[i, 1] - positions[j, 1]
+                        dy -= Ly * np.rint(dy / Ly)
+                        if dx*dx + dy*dy <= radiusSquared:
+                            if write == 1:
+                                pairs[counts[i] + found, 0] = i
+                                pairs[counts[i] + found, 1] = j
+                            found += 1
+            if write == 0:
+                counts[i + 1] = found
+    return pairs
+
+def getNeighbourPairs(positions, domainSize, radius):
+    """
+    Determines all pairs of individuals within the radius of each other, respecting the periodic boundaries. 
+    2D domains use a cell list, other domains a k-d tree.
+
+    Params:
+        - positions (array of floats): the position of every individual at the current timestep
+        - domainSize (tuple of floats): the size of the domain
+        - radius (float): the perception radius of the individuals
+
+    Returns:
+        An array of shape (numberOfPairs, 2) containing every pair of neighbours once.
+    """
+    if len(domainSize) != 2:
+        return getPeriodicTree(positions, domainSize).query_pairs(radius, output_type='ndarray')
+    domainSize = np.asarray(domainSize, dtype=float)
+    wrapped = np.ascontiguousarray(np.mod(positions, domainSize), dtype=np.float64)
+    return getPeriodicNeighbourPairs(wrapped, float(radius), domainSize[0], domainSize[1])
+
 def getNeighbours(positions, domainSize, radius):
     """
     Determines all the neighbours for each individual.
@@ -39,16 +288,92 @@ def getNeighbours(positions, domainSize, radius):
     Returns:
         An array of arrays of booleans representing whether or not any two individuals are neighbours
     """
-    rij2 = getPositionDifferences(positions, domainSize)
-    return (rij2 <= radius**2)
+    n = len(positions)
+    pairs = getNeighbourPairs(positions, domainSize, radius)
+    neighbours = np.full((n, n), False)
+    neighbours[pairs[:, 0], pairs[:, 1]] = True
+    neighbours[pairs[:, 1], pairs[:, 0]] = True
+    np.fill_diagonal(neighbours, True)
+    return neighbours
 
 def getNeighboursWithLimitedVision(positions, orientations, domainSize, radius, fov=2*np.pi, agent_radius=1, occlusion_active=False):
     candidates = getNeighbours(positions=positions, domainSize=domainSize, radius=radius)
     visibles = ServiceVision.compute_visibility_mask(positions=positions, orientations=orientations, fov=fov, view_distance=radius, agent_radius=agent_radius, occlusion_active=occlusion_active)
-    combined = candidates & visibles
+    combined = np.logical_and(candidates, visibles, out=candidates)
     np.fill_diagonal(combined, True)
     return combined
 
+def getNeighbourRowsWithLimitedVision(positions, orientations, indices, domainSize, radius, fov=2*np.pi, agent_radius=1, occlusion_active=False):
+    """
+    Determines the neighbours of only some of the individuals. Equivalent to the rows of 
+    getNeighboursWithLimitedVision() for the given individuals at a cost linear in the number of individuals per row.
+
+    Params:
+        - positions (array of floats): the position of every individual at the current timestep
+        - orientations (array of floats): the orientation of every individual at the current timestep
+        - indices (array of ints): the individuals whose neighbours are determined
+        - domainSize (tuple of floats): the size of the domain
+        - radius (float): the perception radius of the individuals
+        - fov (float) [optional]: the field of vision of the individuals in radians. By default 2pi
+        - agent_radius (float) [optional]: the radius of the individuals that determines how much they occlude. By default 1
+        - occlusion_active (boolean) [optional]: whether individuals hide the individuals behind them. By default False
+
+    Returns:
+        An array of arrays of booleans representing whether or not the given individuals and any individual are neighbours.
+    """
+    domainSize = np.asarray(domainSize, dtype=float)
+    rij = positions[np.newaxis, :, :] - positions[indices, np.newaxis, :]
+    rij = rij - domainSize*np.rint(rij/domainSize) #minimum image convention
+    neighbours = np.sum(rij**2, axis=2) <= radius**2
+    angles = ServiceOrientations.computeAnglesForOrientations(orientations)
+    visibles = ServiceVision.visibility_rows(positions, angles, fov, radius, agent_radius, occlusion_active, indices=indices)
+    for row, visible in zip(neighbours, visibles):
+        np.logical_and(row, visible, out=row)
+    neighbours[np.arange(len(indices)), indices] = True
+    return neighbours
+
+def getNeighbourIndicesWithLimitedVision(positions, orientations, domainSize, radius, fov=2*np.pi, agent_radius=1, occlusion_active=False):
+    """
+    Determines the neighbours of every individual in the compressed sparse row format, i.e. the column indices of every row and 
+    the index at which every row starts. Equivalent to the rows of getNeighboursWithLimitedVision(), but only the pairs within 
+    the radius are checked for visibility, so the neighbourhood mask is never allocated.
+
+    Params:
+        - positions (array of floats): the position of every individual at the current timestep
+        - orientations (array of floats): the orientation of every individual at the current timestep
+        - domainSize (tuple of floats): the size of the domain
+        - radius (float): the perception radius of the individuals
+        - fov (float) [optional]: the field of vision of the individuals in radians. By default 2pi
+        - agent_radius (float) [optional]: the radius of the individuals that determines how much they occlude. By default 1
+        - occlusion_active (boolean) [optional]: whether individuals hide the individuals behind them. By default False
+
+    Returns:
+        The indices of the neighbours of all individuals (including self) in ascending order and the index at which the neighbours of every individual start.
+    """
+    n = len(positions)
+    # the vision only considers the x- and y-coordinates, so the candidates, which include all individuals that can 
+    # occlude, are the pairs within the radius in that plane
+    pairs = getNeighbourPairs(positions[:, :2], domainSize[:2], radius)
+    rows = np.concatenate((pairs[:, 0], pairs[:, 1]))
+    cols = np.concatenate((pairs[:, 1], pairs[:, 0]))
+    order = np.lexsort((cols, rows))
+    rows = rows[order]
+    cols = cols[order]
+    starts = np.searchsorted(rows, np.arange(n + 1))
+    angles = ServiceOrientations.computeAnglesForOrientations(orientations)
+    visible = ServiceVision.visible_pairs(positions, angles, cols, starts, fov, radius, agent_radius, occlusion_active)
+    if len(domainSize) > 2:
+        domainSize = np.asarray(domainSize, dtype=float)
+        rij = positions[cols] - positions[rows]
+        rij = rij - domainSize*np.rint(rij/domainSize) #minimum image convention
+        visible &= np.sum(rij**2, axis=1) <= radius**2
+    # every individual is its own neighbour
+    rows = np.concatenate((rows[visible], np.arange(n)))
+    cols = np.concatenate((cols[visible], np.arange(n)))
+    order = np.lexsort((cols, rows))
+    starts = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=n))[:-1]))
+    return cols[order], starts
+
 def padArray(a, n, kMin, kMax, paddingValue=-1):
     if kMax > len(a[0]):
         minusDiff = np.full((n,kMax-kMin), paddingValue)
@@ -1,7 +1,25 @@
 import numpy as np
+from numba import njit, prange, float32
 
 import services.ServiceOrientations as ServiceOrientations
 
+# number of agents per block in the pairwise kernels so that both blocks stay in the L1 cache
+TILE_SIZE = 64
+
+# the signatures of the kernels are given explicitly so that they are compiled (or loaded from the cache) on import 
+# rather than during the first timestep. The arguments are prepared by _get_kernel_arguments()
+_VISIBLE_KERNEL_SIGNATURE = "void(f4[::1], f4[::1], f4[::1], f4[::1], f4, f4, f4, b1, b1, b1[:, ::1])"
+_VISIBLE_FULL_FOV_KERNEL_SIGNATURE = "void(f4[::1], f4[::1], f4, f4, b1, b1, b1[:, ::1])"
+_VISIBLE_ROW_KERNEL_SIGNATURE = "void(i8, f4[::1], f4[::1], f4[::1], f4[::1], f4, f4, f4, b1, b1[::1])"
+_VISIBLE_PAIRS_KERNEL_SIGNATURE = "void(i8[::1], i8[::1], f4[::1], f4[::1], f4[::1], f4[::1], f4, f4, f4, b1, b1[::1])"
+_FIELD_OF_VISION_KERNEL_SIGNATURE = "void(f8[:, :], f8[::1], f8[::1], b1[:, ::1])"
+
+# number of angular buckets into which the candidates of an agent are sorted by bearing for the occlusion
+OCCLUSION_BUCKETS = 256
+
+# boundaries of the field of vision that are closer than this (in radians) are treated as identical, i.e. as a full 
+# field of vision, since rounding can move the boundaries of a 2pi field of vision apart by a few ulps
+FULL_FOV_TOLERANCE = 1e-9
 
 def determineMinMaxAngleOfVision(orientations, degreesOfVision):
     """
@@ -15,59 +33,226 @@ def determineMinMaxAngleOfVision(orientations, degreesOfVision):
         Two integers representing the angular boundary of vision, i.e. the minimal and maximal angle that is still visible to the particle
     """
     angularDistance = degreesOfVision / 2
-    currentAngles = normaliseAngles(ServiceOrientations.computeAnglesForOrientations(orientations))
-    
+    # the boundaries are normalised once they are known as np.mod handles angles of any size
+    currentAngles = ServiceOrientations.computeAnglesForOrientations(orientations)
+
     minAngles = normaliseAngles(currentAngles - angularDistance)
     maxAngles = normaliseAngles(currentAngles + angularDistance)
 
     return minAngles, maxAngles
 
-
 def isInFieldOfVision(positions, minAngles, maxAngles):
     """
-    Checks if a given particle is within the field of vision of the current particle.
+    Checks for every pair of particles if the second particle is within the field of vision of the first.
 
     Params:
-        - positionParticle (array of floats): the position of the current particle in (x,y)-coordinates
-        - positionCandidate (array of floats): the position of the particle that is considered as potentially visible to the current particle
-        - minAngle (float): the left boundary of the field of vision
-        - maxAngle (float): the right boundary of the field of vision
+        - positions (array of floats): the position of every particle in (x,y)-coordinates
+        - minAngles (array of floats): the left boundary of the field of vision of every particle
+        - maxAngles (array of floats): the right boundary of the field of vision of every particle
 
     Returns:
-        A boolean representing whether the given particle is in the field of vision of the current particle.
+        An array of arrays of booleans representing whether particle j is in the field of vision of particle i.
     """
-    posDiffs=positions-positions[:,np.newaxis,:]  
-    relativeAngles = np.arctan(posDiffs[:, :, 1], posDiffs[:, :, 0])
-    angles = relativeAngles % (2*np.pi)
-    return ((minAngles < maxAngles) & ((angles >= minAngles) & (angles <= maxAngles))) | ((minAngles >= maxAngles) & ((angles >= minAngles) | (angles <= maxAngles)))
+    # measuring the angles from the left boundary covers both the normal and the wrapped-around field of vision. 
+    # Identical boundaries mean that the whole surroundings are visible
+    widths = (maxAngles - minAngles) % (2*np.pi)
+    widths = np.where((widths <= FULL_FOV_TOLERANCE) | (widths >= 2*np.pi - FULL_FOV_TOLERANCE), 2*np.pi, widths)
+    if np.all(widths >= 2*np.pi):
+        return np.ones((len(positions), len(positions)), dtype=np.bool_)
+    inFieldOfVision = np.empty((len(positions), len(positions)), dtype=np.bool_)
+    _fieldOfVisionKernel(np.asarray(positions, dtype=np.float64), np.ascontiguousarray(minAngles, dtype=np.float64), 
+                         np.ascontiguousarray(widths, dtype=np.float64), inFieldOfVision)
+    return inFieldOfVision
 
-def normaliseAngles(angles):
+@njit(inline="always", fastmath=True, error_model="numpy", cache=True)
+def _fastAtan2(y, x):
     """
-    Normalises the degrees of an angle to be between 0 and 2pi.
+    Approximates np.arctan2() with a polynomial (Hastings, error below 4e-8 radians) on the ratio of the smaller to 
+    the larger absolute coordinate, which lies within [0,1]. The other octants follow from symmetry.
 
     Params:
-        - angle (float): the angle in radians
+        - y (float): the y-coordinate
+        - x (float): the x-coordinate
 
     Returns:
-        Float representing the normalised angle.
+        The angle of (x,y) in radians within [-pi, pi].
     """
-    angles = np.where((angles < 0), ((2*np.pi)-np.absolute(angles)), angles)
-    angles = np.where((angles > (2*np.pi)), (angles % (2*np.pi)), angles)
+    absX = abs(x)
+    absY = abs(y)
+    largest = max(absX, absY)
+    if largest == 0:
+        return 0.0
+    a = min(absX, absY) / largest
+    s = a * a
+    angle = a * (0.9999993329 + s * (-0.3332985605 + s * (0.1994653599 + s * (-0.1390853351 + s * (0.0964200441 
+                 + s * (-0.0559098861 + s * (0.0218612288 + s * -0.0040540580)))))))
+    if absY > absX:
+        angle = np.pi/2 - angle
+    if x < 0:
+        angle = np.pi - angle
+    if y < 0:
+        angle = -angle
+    return angle
 
-    return angles
+@njit(_FIELD_OF_VISION_KERNEL_SIGNATURE, parallel=True, fastmath=True, error_model="numpy", cache=True)
+def _fieldOfVisionKernel(positions, minAngles, widths, out):
+    """
+    Computes the angle to every other particle in blocks of TILE_SIZE x TILE_SIZE particles so that neither 
+    the differences nor the angles of all pairs need to be held in memory. Only the blocks on and above the 
+    diagonal are computed as the angle from j to i is the angle from i to j turned by pi.
 
-def compute_invisibility_mask(positions, orientations, fov=2*np.pi, view_distance=np.inf, agent_radius=1, occlusion_active=False):
-    return np.logical_not(compute_visibility_mask(positions, orientations, fov, view_distance, agent_radius, occlusion_active))
+    Params:
+        - positions (array of floats): the position of every particle in (x,y)-coordinates
+        - minAngles (array of floats): the left boundary of the field of vision of every particle
+        - widths (array of floats): the width of the field of vision of every particle
+        - out (array of arrays of booleans): the array that the results are written into
 
-def compute_visibility_mask(positions, orientations, fov=2*np.pi, view_distance=np.inf, agent_radius=1, occlusion_active=False):
+    Returns:
+        Nothing.
+    """
+    n = positions.shape[0]
+    for blockI in prange((n + TILE_SIZE - 1) // TILE_SIZE):
+        startI = blockI * TILE_SIZE
+        endI = min(startI + TILE_SIZE, n)
+        for startJ in range(startI, n, TILE_SIZE):
+            endJ = min(startJ + TILE_SIZE, n)
+            for i in range(startI, endI):
+                # the angle of a particle to itself is 0 as for np.arctan2(0, 0)
+                if startJ == startI:
+                    out[i, i] = ((-minAngles[i]) % (2*np.pi)) <= widths[i]
+                for j in range(max(startJ, i + 1), endJ):
+                    angle = _fastAtan2(positions[j, 1] - positions[i, 1], positions[j, 0] - positions[i, 0]) % (2*np.pi)
+                    out[i, j] = ((angle - minAngles[i]) % (2*np.pi)) <= widths[i]
+                    out[j, i] = ((angle + np.pi - minAngles[j]) % (2*np.pi)) <= widths[j]
+
+def normaliseAngles(angles):
+    """
+    Normalises the degrees of an angle to be between 0 and 2pi. Works for angles of any size, including 
+    negative angles below -2pi.
+
+    Params:
+        - angles (float or array of floats): the angle in radians
+
+    Returns:
+        Float or array of floats representing the normalised angle.
+    """
+    return np.mod(angles, 2*np.pi)
+
+def compute_invisibility_mask(positions, orientations, fov=2*np.pi, view_distance=np.inf, agent_radius=1, occlusion_active=False, out=None):
+    return compute_visibility_mask(positions, orientations, fov, view_distance, agent_radius, occlusion_active, out, invert=True)
+
+def compute_visibility_mask(positions, orientations, fov=2*np.pi, view_distance=np.inf, agent_radius=1, occlusion_active=False, out=None, invert=False):
     angles = ServiceOrientations.computeAnglesForOrientations(orientations)
-    indices = get_visible_agents(positions, angles, fov, view_distance, agent_radius, occlusion_active)
-    mask = np.full((len(positions), len(positions)), False)
-    for i in range(len(positions)):
-        mask[i][indices[i]] = True
-    np.fill_diagonal(mask, True)
+    mask = get_visibility_mask(positions, angles, fov, view_distance, agent_radius, occlusion_active, out, invert)
+    np.fill_diagonal(mask, not invert)
     return mask
 
+def get_visibility_mask(positions, orientations, fov=2*np.pi, view_distance=np.inf, agent_radius=1, occlusion_active=False, out=None, invert=False):
+    """
+    Determine which agents are visible (not occluded) from each agent's perspective.
+
+    Args:
+        positions: (n, 2) array of x, y positions
+        orientations: (n,) array of orientations in radians
+        fov: Field of view in radians (default 2*pi)
+        view_distance: how far the agents can see (default infinite)
+        agent_radius: the radius of the agents that determines how much they occlude
+        occlusion_active: whether agents hide the agents behind them
+        out: (n, n) boolean array that is reused for the result instead of allocating a new one (optional)
+        invert: whether the invisible agents should be marked instead, i.e. the negated mask is returned (default False)
+
+    Returns:
+        visibility: (n, n) boolean array, where visibility[i, j] is True if agent j is visible to agent i
+    """
+    n = positions.shape[0]
+    if out is None:
+        mask = np.full((n, n), invert, dtype=np.bool_)
+    else:
+        mask = out
+        mask.fill(invert)
+    px, py, forward_x, forward_y, cos_half_fov, view_distance_squared, agent_radius = _get_kernel_arguments(positions, orientations, fov, view_distance, agent_radius)
+    if fov >= 2*np.pi:
+        # every agent within the view distance is within the field of view, so the orientations are not needed
+        _visible_full_fov_kernel(px, py, view_distance_squared, agent_radius, bool(occlusion_active), bool(invert), mask)
+    else:
+        _visible_kernel(px, py, forward_x, forward_y, cos_half_fov, view_distance_squared, agent_radius, bool(occlusion_active), bool(invert), mask)
+    return mask
+
+def visibility_rows(positions, orientations, fov=2*np.pi, view_distance=np.inf, agent_radius=1, occlusion_active=False, out=None, indices=None):
+    """
+    Determine which agents are visible (not occluded) from each agent's perspective one agent at a time so that 
+    the (n, n) mask never needs to be held in memory. Equivalent to iterating over the rows of get_visibility_mask().
+
+    Args:
+        positions: (n, 2) array of x, y positions
+        orientations: (n,) array of orientations in radians
+        fov: Field of view in radians (default 2*pi)
+        view_distance: how far the agents can see (default infinite)
+        agent_radius: the radius of the agents that determines how much they occlude
+        occlusion_active: whether agents hide the agents behind them
+        out: (n,) boolean array that is reused for every row instead of allocating a new one (optional)
+        indices: the agents whose rows are determined, in the order in which they are yielded (default all agents)
+
+    Yields:
+        visibility: (n,) boolean array, where visibility[j] is True if agent j is visible to agent i. The same 
+        array is overwritten for the next agent and needs to be copied if it is kept
+    """
+    n = positions.shape[0]
+    row = np.empty(n, dtype=np.bool_) if out is None else out
+    arguments = _get_kernel_arguments(positions, orientations, fov, view_distance, agent_radius)
+    for i in (range(n) if indices is None else indices):
+        _visible_row_kernel(int(i), *arguments, bool(occlusion_active), row)
+        yield row
+
+def visible_pairs(positions, orientations, cols, starts, fov=2*np.pi, view_distance=np.inf, agent_radius=1, occlusion_active=False):
+    """
+    Determine which of the given candidates are visible (not occluded) from each agent's perspective. Equivalent to 
+    looking up the candidates in get_visibility_mask() as long as the candidates include every agent within the view 
+    distance, but only the candidates are checked and the (n, n) mask is never allocated.
+
+    Args:
+        positions: (n, 2) array of x, y positions
+        orientations: (n,) array of orientations in radians
+        cols: the indices of the candidates of all agents in ascending order per agent
+        starts: (n + 1,) array of the index at which the candidates of every agent start followed by len(cols)
+        fov: Field of view in radians (default 2*pi)
+        view_distance: how far the agents can see (default infinite)
+        agent_radius: the radius of the agents that determines how much they occlude
+        occlusion_active: whether agents hide the agents behind them
+
+    Returns:
+        visibility: boolean array of the same length as cols, where visibility[index] is True if the candidate is visible
+    """
+    visible = np.empty(len(cols), dtype=np.bool_)
+    _visible_pairs_kernel(np.ascontiguousarray(cols, dtype=np.int64), np.ascontiguousarray(starts, dtype=np.int64), 
+                          *_get_kernel_arguments(positions, orientations, fov, view_distance, agent_radius), bool(occlusion_active), visible)
+    return visible
+
+def _get_kernel_arguments(positions, orientations, fov, view_distance, agent_radius):
+    """
+    Prepares the geometry shared by _visible_kernel() and _visible_row_kernel().
+
+    Args:
+        positions: (n, 2) array of x, y positions
+        orientations: (n,) array of orientations in radians
+        fov: Field of view in radians
+        view_distance: how far the agents can see
+        agent_radius: the radius of the agents that determines how much they occlude
+
+    Returns:
+        The x and y positions, the x and y components of the forward directions, the cosine of half the field of view, 
+        the squared view distance and the agent radius in single precision
+    """
+    # the kernels are compiled with fastmath, which does not allow infinite values
+    view_distance_squared = view_distance**2 if np.isfinite(view_distance) else np.finfo(np.float32).max
+    # single precision is sufficient for the geometry. The coordinates are passed as separate contiguous arrays and 
+    # the forward directions are computed for all agents at once rather than in every row of the kernel
+    px = np.ascontiguousarray(positions[:, 0], dtype=np.float32)
+    py = np.ascontiguousarray(positions[:, 1], dtype=np.float32)
+    orientations = np.asarray(orientations, dtype=np.float32)
+    return (px, py, np.cos(orientations), np.sin(orientations), np.float32(np.cos(min(fov, 2*np.pi) / 2)), 
+            np.float32(view_distance_squared), np.float32(agent_radius))
+
 def get_visible_agents(positions, orientations, fov=2*np.pi, view_distance=np.inf, agent_radius=1, occlusion_active=False):
     """
     Determine which agents are visible (not occluded) from each agent's perspective.
@@ -79,50 +264,357 @@ def get_visible_agents(positions, orientations, fov=2*np.pi, view_distance=np.in
         fov: Field of view in radians (default 2*pi)
     
     Returns:
-        visibility: list of lists, where visibility[i] contains indices of agents visible to agent i
+        visibility: list of lists, where visibility[i] contains indices of agents visible to agent i, ordered by distance
     """
-    n = positions.shape[0]
     visibility = []
+    for i, row in enumerate(visibility_rows(positions, orientations, fov, view_distance, agent_radius, occlusion_active)):
+        visible = np.flatnonzero(row)
+        differences = positions[visible] - positions[i]
+        visibility.append(visible[np.argsort(np.sum(differences**2, axis=1))])
+    return visibility
 
-    for i in range(n):
-        pos_i = positions[i]
-        orient_i = orientations[i]
-
-        # Vector from i to all other agents
-        rel_pos = positions - pos_i  # (n, 2)
-        distances = np.linalg.norm(rel_pos, axis=1)
-        directions = rel_pos / np.clip(distances[:, None], 1e-8, None)
-
-        # Angle between agent i's orientation and the direction to other agents
-        forward = np.array([np.cos(orient_i), np.sin(orient_i)])
-        cos_angles = directions @ forward  # dot product
-        angles = np.arccos(np.clip(cos_angles, -1, 1))
-
-        # Field of view mask
-        in_fov = (angles <= fov / 2) & (distances > 0) & (distances <= view_distance)
-
-        # Filter agents in field of view
-        candidates = np.where(in_fov)[0]
-        candidate_distances = distances[candidates]
-        sorted_indices = candidates[np.argsort(candidate_distances)]
-
-        if occlusion_active:
-            visible = []
-            occluded_mask = np.zeros(n, dtype=bool)
-
-            for j in sorted_indices:
-                if not occluded_mask[j]:
-                    visible.append(j)
-                    # Occlude any agents behind this one, close to the same direction
-                    rel_vec = positions[j] - pos_i
-                    rel_dir = rel_vec / np.linalg.norm(rel_vec)
-                    dot_prods = (positions - pos_i) @ rel_dir
-                    proj_lens = np.abs(np.cross(positions - pos_i, rel_dir))
-                    occluded = (dot_prods > distances[j]) & (proj_lens < agent_radius)
-                    occluded_mask |= occluded
+@njit(fastmath=True, error_model="numpy", cache=True)
+def _is_in_fov(dot, d2, cos_half_fov, cos_half_fov_squared):
+    """
+    Checks dot >= cos_half_fov * sqrt(d2), i.e. whether the angle between the forward direction and the 
+    direction to the other agent is at most half the field of view, without computing the square root.
+
+    Args:
+        dot: the dot product of the forward direction and the vector to the other agent
+        d2: the squared distance to the other agent
+        cos_half_fov: the cosine of half the field of view
+        cos_half_fov_squared: the square of cos_half_fov
+
+    Returns:
+        True if the other agent is within the field of view
+    """
+    if cos_half_fov >= 0:
+        return dot >= 0 and dot*dot >= cos_half_fov_squared * d2
+    if cos_half_fov <= -1:
+        # in single precision, the forward direction is not exactly of unit length and the agents directly 
+        # behind would otherwise be lost for a full field of view
+        return True
+    return dot >= 0 or dot*dot <= cos_half_fov_squared * d2
+
+@njit(cache=True)
+def _sort_by_distance(candidates, distances, count):
+    """
+    Sorts the first count candidates by their distance in place. Only the agents within the view distance 
+    and field of view are candidates, so there are few of them and an insertion sort is faster than a general sort.
+
+    Args:
+        candidates: the indices of the candidates
+        distances: the distance of every candidate. Squared distances result in the same order
+        count: the number of candidates
+    """
+    for a in range(1, count):
+        candidate = candidates[a]
+        distance = distances[a]
+        b = a - 1
+        while b >= 0 and distances[b] > distance:
+            candidates[b + 1] = candidates[b]
+            distances[b + 1] = distances[b]
+            b -= 1
+        candidates[b + 1] = candidate
+        distances[b + 1] = distance
+
+@njit(inline="always", fastmath=True, error_model="numpy", cache=True)
+def _bearing_bucket_unclamped(bearing):
+    """
+    Determines the index of the angular bucket of a bearing. Bearings outside of [-pi, pi] yield indices outside 
+    of [0, OCCLUSION_BUCKETS) that can be wrapped with a modulo.
+
+    Args:
+        bearing: the angle to the other agent
+
+    Returns:
+        The index of the bucket
+    """
+    return int(np.floor((bearing + np.pi) * (OCCLUSION_BUCKETS / (2*np.pi))))
+
+@njit(inline="always", fastmath=True, error_model="numpy", cache=True)
+def _bearing_bucket(bearing):
+    """
+    Determines the index of the angular bucket of a bearing within [-pi, pi].
+
+    Args:
+        bearing: the angle to the other agent
+
+    Returns:
+        The index of the bucket within [0, OCCLUSION_BUCKETS)
+    """
+    return min(max(_bearing_bucket_unclamped(bearing), 0), OCCLUSION_BUCKETS - 1)
+
+@njit(fastmath=True, error_model="numpy", cache=True)
+def _occlude_candidates(i, px, py, agent_radius, candidates):
+    """
+    Determines which of the agents within the field of view of agent i are not hidden behind other agents.
+
+    Args:
+        i: the index of the agent whose view is determined
+        px: (n,) float32 array of x positions
+        py: (n,) float32 array of y positions
+        agent_radius: the radius of the agents that determines how much they occlude
+        candidates: the indices of the agents within the field of view. Sorted by distance in place
+
+    Returns:
+        The indices of the visible agents
+    """
+    num_candidates = len(candidates)
+    # the squared distances give the same order, so the square root is only needed for the visible agents
+    candidate_distances_squared = np.empty(num_candidates, dtype=np.float32)
+    for index in range(num_candidates):
+        dx = px[candidates[index]] - px[i]
+        dy = py[candidates[index]] - py[i]
+        candidate_distances_squared[index] = dx*dx + dy*dy
+
+    # the closest agents are visible unless they are hidden behind an agent that is even closer
+    _sort_by_distance(candidates, candidate_distances_squared, num_candidates)
+
+    # the candidates are sorted into buckets by their bearing so that an agent only needs to check the 
+    # candidates within the angle covered by its shadow. The offsets are stored contiguously in the order of 
+    # the candidates for the occlusion test
+    offsets_x = np.empty(num_candidates, dtype=np.float32)
+    offsets_y = np.empty(num_candidates, dtype=np.float32)
+    bearings = np.empty(num_candidates, dtype=np.float32)
+    bucket_starts = np.zeros(OCCLUSION_BUCKETS + 1, dtype=np.int64)
+    for index in range(num_candidates):
+        j = candidates[index]
+        offsets_x[index] = px[j] - px[i]
+        offsets_y[index] = py[j] - py[i]
+        bearings[index] = np.arctan2(offsets_y[index], offsets_x[index])
+        bucket_starts[_bearing_bucket(bearings[index]) + 1] += 1
+    for bucket in range(OCCLUSION_BUCKETS):
+        bucket_starts[bucket + 1] += bucket_starts[bucket]
+    bucket_fill = bucket_starts[:-1].copy()
+    bucket_members = np.empty(num_candidates, dtype=np.int64)
+    for index in range(num_candidates):
+        bucket = _bearing_bucket(bearings[index])
+        bucket_members[bucket_fill[bucket]] = index
+        bucket_fill[bucket] += 1
+
+    occluded = np.zeros(num_candidates, dtype=np.bool_)
+    visible = np.empty(num_candidates, dtype=np.int64)
+    num_visible = 0
+    for index in range(num_candidates):
+        if occluded[index]:
+            continue
+        j = candidates[index]
+        visible[num_visible] = j
+        num_visible += 1
+        distance = np.sqrt(candidate_distances_squared[index])
+        rx = offsets_x[index] / distance
+        ry = offsets_y[index] / distance
+        # an agent hidden by j lies within atan(agent_radius / distance) of the bearing of j. The buckets 
+        # at the edges of that angle are included as a whole so that rounding cannot miss any agents
+        half_angle = np.arctan(agent_radius / distance) + 2*np.pi / OCCLUSION_BUCKETS
+        if half_angle >= np.pi:
+            first_bucket = 0
+            last_bucket = OCCLUSION_BUCKETS - 1
         else:
-            visible = sorted_indices
+            first_bucket = _bearing_bucket_unclamped(bearings[index] - half_angle)
+            last_bucket = _bearing_bucket_unclamped(bearings[index] + half_angle)
+        for bucket in range(first_bucket, last_bucket + 1):
+            wrapped_bucket = bucket % OCCLUSION_BUCKETS
+            for member in range(bucket_starts[wrapped_bucket], bucket_starts[wrapped_bucket + 1]):
+                k = bucket_members[member]
+                # only agents that are further away than j can be hidden by it
+                if k <= index or occluded[k]:
+                    continue
+                # the projection onto the direction of j and the distance from that line, i.e. the dot and 
+                # cross product written out for two dimensions
+                dx = offsets_x[k]
+                dy = offsets_y[k]
+                if dx*rx + dy*ry > distance and abs(dx*ry - dy*rx) < agent_radius:
+                    occluded[k] = True
+    return visible[:num_visible]
+
+@njit(fastmath=True, error_model="numpy", cache=True)
+def _occlude_row(i, px, py, agent_radius, invert, row):
+    """
+    Removes the agents that are hidden behind other agents from the agents within the field of view of agent i.
+
+    Args:
+        i: the index of the agent whose view is determined
+        px: (n,) float32 array of x positions
+        py: (n,) float32 array of y positions
+        agent_radius: the radius of the agents that determines how much they occlude
+        invert: whether the row marks the agents outside of the field of view rather than those inside
+        row: (n,) boolean array of the agents within the field of view. Updated in place
+    """
+    candidates = np.flatnonzero(row != invert)
+    for j in candidates:
+        row[j] = invert
+    for j in _occlude_candidates(i, px, py, agent_radius, candidates):
+        row[j] = not invert
+
+@njit(_VISIBLE_KERNEL_SIGNATURE, parallel=True, fastmath=True, error_model="numpy", cache=True, 
+      locals={"fx": float32, "fy": float32, "dx": float32, "dy": float32, "d2": float32})
+def _visible_kernel(px, py, forward_x, forward_y, cos_half_fov, view_distance_squared, agent_radius, occlusion_active, invert, out_mask):
+    """
+    Marks which agents every agent can see. The pairs are processed in blocks of TILE_SIZE x TILE_SIZE agents 
+    so that the positions of both blocks stay in the cache. With occlusion, the agents within the field of view 
+    are then filtered row by row.
+
+    Args:
+        px: (n,) float32 array of x positions
+        py: (n,) float32 array of y positions
+        forward_x: (n,) array of the x-components of the forward directions, i.e. the cosines of the orientations
+        forward_y: (n,) array of the y-components of the forward directions, i.e. the sines of the orientations
+        cos_half_fov: the cosine of half the field of view
+        view_distance_squared: the squared distance up to which the agents can see
+        agent_radius: the radius of the agents that determines how much they occlude
+        occlusion_active: whether agents hide the agents behind them
+        invert: whether the invisible rather than the visible agents are marked
+        out_mask: (n, n) boolean array filled with invert that the visibility is written into
+    """
+    n = px.shape[0]
+    cos_half_fov_squared = cos_half_fov * cos_half_fov
+    for block_i in prange((n + TILE_SIZE - 1) // TILE_SIZE):
+        start_i = block_i * TILE_SIZE
+        end_i = min(start_i + TILE_SIZE, n)
+        for start_j in range(0, n, TILE_SIZE):
+            end_j = min(start_j + TILE_SIZE, n)
+            for i in range(start_i, end_i):
+                fx = forward_x[i]
+                fy = forward_y[i]
+                for j in range(start_j, end_j):
+                    dx = px[j] - px[i]
+                    dy = py[j] - py[i]
+                    d2 = dx*dx + dy*dy
+                    if d2 == 0 or d2 > view_distance_squared:
+                        continue
+                    if _is_in_fov(dx*fx + dy*fy, d2, cos_half_fov, cos_half_fov_squared):
+                        out_mask[i, j] = not invert
+    if not occlusion_active:
+        return
+
+    for i in prange(n):
+        _occlude_row(i, px, py, agent_radius, invert, out_mask[i])
+
+@njit(_VISIBLE_FULL_FOV_KERNEL_SIGNATURE, parallel=True, fastmath=True, error_model="numpy", cache=True, 
+      locals={"dx": float32, "dy": float32, "d2": float32})
+def _visible_full_fov_kernel(px, py, view_distance_squared, agent_radius, occlusion_active, invert, out_mask):
+    """
+    Marks which agents every agent can see if the agents see their whole surroundings. Equivalent to _visible_kernel() 
+    with a field of view of 2*pi. Only the distance is checked, which is the same in both directions, so only the 
+    blocks on and above the diagonal are computed.
 
-        visibility.append(visible)
+    Args:
+        px: (n,) float32 array of x positions
+        py: (n,) float32 array of y positions
+        view_distance_squared: the squared distance up to which the agents can see
+        agent_radius: the radius of the agents that determines how much they occlude
+        occlusion_active: whether agents hide the agents behind them
+        invert: whether the invisible rather than the visible agents are marked
+        out_mask: (n, n) boolean array filled with invert that the visibility is written into
+    """
+    n = px.shape[0]
+    for block_i in prange((n + TILE_SIZE - 1) // TILE_SIZE):
+        start_i = block_i * TILE_SIZE
+        end_i = min(start_i + TILE_SIZE, n)
+        for start_j in range(start_i, n, TILE_SIZE):
+            end_j = min(start_j + TILE_SIZE, n)
+            for i in range(start_i, end_i):
+                for j in range(max(start_j, i + 1), end_j):
+                    dx = px[j] - px[i]
+                    dy = py[j] - py[i]
+                    d2 = dx*dx + dy*dy
+                    if d2 == 0 or d2 > view_distance_squared:
+                        continue
+                    out_mask[i, j] = not invert
+                    out_mask[j, i] = not invert
+    if not occlusion_active:
+        return
+
+    for i in prange(n):
+        _occlude_row(i, px, py, agent_radius, invert, out_mask[i])
+
+@njit(_VISIBLE_ROW_KERNEL_SIGNATURE, fastmath=True, error_model="numpy", cache=True, 
+      locals={"fx": float32, "fy": float32, "dx": float32, "dy": float32, "d2": float32})
+def _visible_row_kernel(i, px, py, forward_x, forward_y, cos_half_fov, view_distance_squared, agent_radius, occlusion_active, out_row):
+    """
+    Marks which agents agent i can see. Equivalent to row i of _visible_kernel().
+
+    Args:
+        i: the index of the agent whose view is determined
+        px: (n,) float32 array of x positions
+        py: (n,) float32 array of y positions
+        forward_x: (n,) array of the x-components of the forward directions, i.e. the cosines of the orientations
+        forward_y: (n,) array of the y-components of the forward directions, i.e. the sines of the orientations
+        cos_half_fov: the cosine of half the field of view
+        view_distance_squared: the squared distance up to which the agents can see
+        agent_radius: the radius of the agents that determines how much they occlude
+        occlusion_active: whether agents hide the agents behind them
+        out_row: (n,) boolean array that the visibility is written into
+    """
+    n = px.shape[0]
+    cos_half_fov_squared = cos_half_fov * cos_half_fov
+    full_fov = cos_half_fov <= -1
+    fx = forward_x[i]
+    fy = forward_y[i]
+    for j in range(n):
+        out_row[j] = False
+        dx = px[j] - px[i]
+        dy = py[j] - py[i]
+        d2 = dx*dx + dy*dy
+        if d2 == 0 or d2 > view_distance_squared:
+            continue
+        if full_fov or _is_in_fov(dx*fx + dy*fy, d2, cos_half_fov, cos_half_fov_squared):
+            out_row[j] = True
+    if occlusion_active:
+        _occlude_row(i, px, py, agent_radius, False, out_row)
+
+@njit(_VISIBLE_PAIRS_KERNEL_SIGNATURE, parallel=True, fastmath=True, error_model="numpy", cache=True, 
+      locals={"fx": float32, "fy": float32, "dx": float32, "dy": float32, "d2": float32})
+def _visible_pairs_kernel(cols, starts, px, py, forward_x, forward_y, cos_half_fov, view_distance_squared, agent_radius, occlusion_active, out_visible):
+    """
+    Marks which of its candidates every agent can see. Equivalent to looking up the candidates in the rows of _visible_kernel().
+
+    Args:
+        cols: the indices of the candidates of all agents in ascending order per agent
+        starts: (n + 1,) array of the index at which the candidates of every agent start followed by len(cols)
+        px: (n,) float32 array of x positions
+        py: (n,) float32 array of y positions
+        forward_x: (n,) array of the x-components of the forward directions, i.e. the cosines of the orientations
+        forward_y: (n,) array of the y-components of the forward directions, i.e. the sines of the orientations
+        cos_half_fov: the cosine of half the field of view
+        view_distance_squared: the squared distance up to which the agents can see
+        agent_radius: the radius of the agents that determines how much they occlude
+        occlusion_active: whether agents hide the agents behind them
+        out_visible: boolean array of the same length as cols that the visibility is written into
+    """
+    n = px.shape[0]
+    cos_half_fov_squared = cos_half_fov * cos_half_fov
+    for i in prange(n):
+        fx = forward_x[i]
+        fy = forward_y[i]
+        num_candidates = 0
+        for index in range(starts[i], starts[i + 1]):
+            j = cols[index]
+            dx = px[j] - px[i]
+            dy = py[j] - py[i]
+            d2 = dx*dx + dy*dy
+            out_visible[index] = d2 != 0 and d2 <= view_distance_squared and _is_in_fov(dx*fx + dy*fy, d2, cos_half_fov, cos_half_fov_squared)
+            if out_visible[index]:
+                num_candidates += 1
+        if not occlusion_active or num_candidates == 0:
+            continue
+        row_cols = cols[starts[i]:starts[i + 1]]
+        row_visible = out_visible[starts[i]:starts[i + 1]]
+        candidates = row_cols[row_visible]
+        row_visible[:] = False
+        # the candidates of every agent are in ascending order, so the visible agents can be found by bisection
+        for j in _occlude_candidates(i, px, py, agent_radius, candidates):
+            row_visible[np.searchsorted(row_cols, j)] = True
+
+def _warm_up():
+    """
+    Runs the parallel kernels on two agents so that the threading layer is started on import rather than during 
+    the first timestep.
+    """
+    positions = np.array([[0.0, 0.0], [1.0, 0.0]])
+    orientations = np.array([[1.0, 0.0], [-1.0, 0.0]])
+    compute_visibility_mask(positions, orientations, occlusion_active=True)
 
-    return visibility
\ No newline at end of file
+_warm_up()
@@ -0,0 +1,87 @@
+import unittest
+
+import numpy as np
+
+from model.Vicsek import VicsekWithNeighbourSelection as Vicsek
+from model.VicsekIndividualsMultiSwitch import VicsekWithNeighbourSelection as VicsekMultiSwitch
+from model.VicsekIndividualsMultiSwitchOscillation import VicsekWithNeighbourSelectionOscillation
+from model.VicsekIndividualsMultiSwitchOscillationFood import VicsekWithNeighbourSelectionOscillationFood
+from enums.EnumNeighbourSelectionMechanism import NeighbourSelectionMechanism
+from enums.EnumSwitchType import SwitchType
+
+from model.SwitchInformation import SwitchInformation
+from model.SwitchSummary import SwitchSummary
+
+DOMAIN_SIZE = (20, 20)
+NUMBER_OF_PARTICLES = 20
+TMAX = 5
+
+
+def createSwitchSummary():
+    info = SwitchInformation(switchType=SwitchType.NEIGHBOUR_SELECTION_MECHANISM,
+                             values=(NeighbourSelectionMechanism.FARTHEST, NeighbourSelectionMechanism.NEAREST),
+                             thresholds=[0.1],
+                             numberPreviousStepsForThreshold=2)
+    return SwitchSummary([info])
+
+def createSwitchingModelParameters(switchSummary, degreesOfVision):
+    return {"domainSize": DOMAIN_SIZE,
+            "radius": 5,
+            "noise": 0.1,
+            "numberOfParticles": NUMBER_OF_PARTICLES,
+            "k": 1,
+            "neighbourSelectionMechanism": NeighbourSelectionMechanism.NEAREST,
+            "switchSummary": switchSummary,
+            "events": [],
+            "degreesOfVision": degreesOfVision,
+            "seed": 1}
+
+
+class TestModelsSmoke(unittest.TestCase):
+    """
+    Runs a few timesteps of every model to make sure that the simulation loops still run end to end.
+    """
+
+    def assertValidHistories(self, simulator, simulationData):
+        times, positionsHistory, orientationsHistory = simulationData
+        numIntervals = simulator.numIntervals
+        self.assertEqual(len(times), numIntervals)
+        self.assertEqual(positionsHistory.shape[:2], (numIntervals, NUMBER_OF_PARTICLES))
+        self.assertEqual(orientationsHistory.shape[:2], (numIntervals, NUMBER_OF_PARTICLES))
+        self.assertTrue(np.all(np.isfinite(positionsHistory)))
+        self.assertTrue(np.all(np.isfinite(orientationsHistory)))
+
+    def test_vicsek(self):
+        for degreesOfVision in (2*np.pi, np.pi):
+            with self.subTest(degreesOfVision=degreesOfVision):
+                simulator = Vicsek(domainSize=DOMAIN_SIZE, radius=5, noise=0.1, numberOfParticles=NUMBER_OF_PARTICLES,
+                                   degreesOfVision=degreesOfVision, seed=1)
+                self.assertValidHistories(simulator, simulator.simulate(tmax=TMAX))
+
+    def test_multi_switch(self):
+        for switchSummary in (None, createSwitchSummary()):
+            for degreesOfVision in (2*np.pi, np.pi):
+                with self.subTest(switching=switchSummary != None, degreesOfVision=degreesOfVision):
+                    simulator = VicsekMultiSwitch(**createSwitchingModelParameters(switchSummary, degreesOfVision))
+                    simulationData, _ = simulator.simulate(tmax=TMAX)
+                    self.assertValidHistories(simulator, simulationData)
+
+    def test_oscillation(self):
+        for switchSummary in (None, createSwitchSummary()):
+            for degreesOfVision in (2*np.pi, np.pi):
+                with self.subTest(switching=switchSummary != None, degreesOfVision=degreesOfVision):
+                    simulator = VicsekWithNeighbourSelectionOscillation(**createSwitchingModelParameters(switchSummary, degreesOfVision))
+                    simulationData, _, _ = simulator.simulate(tmax=TMAX)
+                    self.assertValidHistories(simulator, simulationData)
+
+    def test_oscillation_food(self):
+        for degreesOfVision in (2*np.pi, np.pi):
+            with self.subTest(degreesOfVision=degreesOfVision):
+                simulator = VicsekWithNeighbourSelectionOscillationFood(maxFood=5, foodAppearanceProbability=0.5,
+                                                                        **createSwitchingModelParameters(createSwitchSummary(), degreesOfVision))
+                simulationData = simulator.simulate(tmax=TMAX)[0]
+                self.assertValidHistories(simulator, simulationData)
+
+
+if __name__ == "__main__":
+    unittest.main()